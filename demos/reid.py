@@ -37,20 +37,18 @@ def main():
         image_prepared = objdet_preproc(image_rgb)
         boxes = objdet(image_prepared)
 
-        # Draw boxes
-        for box in boxes:
-            if box.label == 'person':
-                # Crop this person image
-                h, w, _ = image_rgb.shape
-                crop = image_rgb[
-                    int(h * box.y_min): int(h * box.y_max),
-                    int(w * box.x_min): int(w * box.x_max)
-                ]
-                crop_prepared = reid_preproc(crop)
-                vec = reid(crop_prepared)
+        # Pass all persons to the reid model at once
+        persons = [box for box in boxes if box.label == 'person']
+        if len(persons) > 0:
+            crops_prepared = reid_preproc.crops(image_rgb, persons)
+            vectors = reid(crops_prepared).reshape(len(persons), -1)
+            for box, vec in zip(persons, vectors):
                 # Find this person in the database
                 key = database.find_closest(vec)
                 box.label = 'person ' + key
+
+        # Draw boxes
+        for box in boxes:
             image = box.draw(image)
 
         database.optimize()
@@ -11,8 +11,16 @@ from .openvino import OpenVINOModel
 from .onnx import ONNXModel
 from .pytorch import TorchModel
 
+# Model wrappers
+from .batching import BatchingModel
+from .pool import DevicePool, ThreadSafeModel
+from .processes import ProcessPoolModel
+
+# Choosing the fastest model
+from .tuning import autotune
+
 # Preprocessing class
 from .preprocessing import Preprocessing
 
 # Output classes
-from .output import DetectionBox
+from .output import DetectionBox, LetterboxTransform
@@ -0,0 +1,235 @@
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+import weakref
+import numpy as np
+
+from . import model as _model
+
+# Request to the batching worker
+_Request = collections.namedtuple('_Request', ['inputs', 'return_info', 'future'])
+
+
+class BatchingModel(_model.Model):
+    '''
+    Wrapper which gathers calls from many threads or coroutines into batches.
+
+    Each call is put into a queue. A background thread takes the queued calls,
+    concatenates their inputs along the batch dimension, calls the wrapped model once
+    and splits the outputs back between the callers.
+
+    The wrapped model must take numpy arrays with a batch dimension
+    and return numpy arrays (or a list, tuple or dictionary of numpy arrays) with the same batch dimension.
+    Base models (:class:`nnio.ONNXModel`, :class:`nnio.OpenVINOModel`, etc.)
+    exported with a dynamic batch size are suitable.
+
+    Usage example::
+
+        model = nnio.BatchingModel(
+            nnio.ONNXModel('path/to/model.onnx'),
+            max_batch_size=16,
+            max_wait=0.005,
+        )
+
+        # Call from many threads. Each call blocks until its result is ready.
+        class_scores = model(image)
+
+        # Or without blocking
+        future = model.submit(image)
+        class_scores = await model.forward_async(image)
+    '''
+    def __init__(
+        self,
+        model,
+        max_batch_size=8,
+        max_wait=0.005,
+    ):
+        '''
+        :parameter model: :class:`nnio.Model` object to call with batches.
+        :parameter max_batch_size: ``int``. Maximal number of samples in one call of ``model``.
+        :parameter max_wait: ``float``. Maximal time (in seconds) the first call in a batch
+            waits for other calls to come.
+        '''
+        super().__init__()
+        if max_batch_size < 1:
+            raise BaseException('max_batch_size must be at least 1, got {}'.format(max_batch_size))
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._closed = False
+        # Calls are not put into the queue after it is closed
+        self._lock = threading.Lock()
+        # The thread does not hold a reference to self, so the wrapper can be garbage-collected.
+        # Then the thread is stopped
+        self._worker = threading.Thread(
+            target=_work, args=(self._queue, model, max_batch_size, max_wait), name=type(self).__name__, daemon=True)
+        self._worker.start()
+        self._finalizer = weakref.finalize(self, self._queue.put, None)
+
+    def forward(self, *inputs, return_info=False):
+        r'''
+        Call the model. Blocks until the batch with this call is processed.
+
+        :parameter \*inputs: numpy arrays with a batch dimension.
+        :parameter return_info: ``bool``. If ``True``, also returns a dictionary
+            with ``invoke_time`` of the whole batch and ``batch_size``.
+        :return: numpy array or list of numpy arrays, as returned by the wrapped model.
+        '''
+        return self.submit(*inputs, return_info=return_info).result()
+
+    def submit(self, *inputs, return_info=False):
+        r'''
+        Put a call into the queue without waiting for the result.
+
+        :parameter \*inputs: numpy arrays with a batch dimension.
+        :parameter return_info: ``bool``. Same as in ``forward``.
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise BaseException('BatchingModel is closed')
+            self._queue.put(_Request(inputs, return_info, future))
+        return future
+
+    def close(self):
+        '''
+        Stop the background thread after processing the calls already in the queue.
+        '''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._finalizer()
+        self._worker.join()
+
+    def get_preprocessing(self):
+        return self.model.get_preprocessing()
+
+    def get_input_details(self):
+        return self.model.get_input_details()
+
+    def get_output_details(self):
+        return self.model.get_output_details()
+
+    def __str__(self):
+        return 'BatchingModel({}, max_batch_size={}, max_wait={})'.format(
+            self.model, self.max_batch_size, self.max_wait)
+
+
+def _work(requests, model, max_batch_size, max_wait):
+    '''
+    Loop of the background thread
+    '''
+    pending = collections.deque()
+    while True:
+        # Wait for the first call
+        if pending:
+            request = pending.popleft()
+        else:
+            request = requests.get()
+        if request is None:
+            break
+        if not request.future.set_running_or_notify_cancel():
+            continue
+
+        # Gather calls with the same input shapes until the deadline
+        batch = [request]
+        key = _batch_key(request.inputs)
+        size = _batch_size(request.inputs)
+        deadline = time.monotonic() + max_wait
+        stop = False
+        while size < max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = requests.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                break
+            if request is None:
+                stop = True
+                break
+            if _batch_key(request.inputs) != key or size + _batch_size(request.inputs) > max_batch_size:
+                # Leave it for the next batch
+                pending.append(request)
+                break
+            if request.future.set_running_or_notify_cancel():
+                batch.append(request)
+                size += _batch_size(request.inputs)
+
+        _run(model, batch, size)
+        if stop:
+            # Process the rest of the calls one by one
+            while pending:
+                request = pending.popleft()
+                if request.future.set_running_or_notify_cancel():
+                    _run(model, [request], _batch_size(request.inputs))
+            break
+
+
+def _run(model, batch, size):
+    '''
+    Call the model with the batch and set results of the futures
+    '''
+    return_info = any(request.return_info for request in batch)
+    try:
+        if len(batch) == 1:
+            inputs = batch[0].inputs
+        else:
+            inputs = [
+                np.concatenate(arrays, axis=0)
+                for arrays in zip(*[request.inputs for request in batch])
+            ]
+        out = model(*inputs, return_info=return_info) if return_info else model(*inputs)
+        if return_info:
+            out, info = out
+            info = dict(info, batch_size=size)
+        if len(batch) == 1:
+            results = [out]
+        else:
+            results = _split_outputs(out, [_batch_size(request.inputs) for request in batch])
+    except BaseException as e: # pylint: disable=broad-except
+        for request in batch:
+            request.future.set_exception(e)
+        return
+
+    for request, result in zip(batch, results):
+        if request.return_info:
+            request.future.set_result((result, dict(info)))
+        else:
+            request.future.set_result(result)
+
+
+def _batch_key(inputs):
+    '''
+    Calls can be batched together only if their inputs have equal shapes (except the batch dimension)
+    and data types
+    '''
+    return tuple((np.shape(x)[1:], np.asarray(x).dtype) for x in inputs)
+
+
+def _batch_size(inputs):
+    return len(inputs[0]) if inputs else 1
+
+
+def _split_outputs(out, sizes):
+    '''
+    Split outputs of the model along the batch dimension.
+
+    :parameter out: numpy array, list, tuple or dictionary of numpy arrays.
+    :parameter sizes: list of batch sizes of the calls.
+    :return: list with outputs of each call.
+    '''
+    if isinstance(out, dict):
+        splits = [_split_outputs(x, sizes) for x in out.values()]
+        return [dict(zip(out.keys(), parts)) for parts in zip(*splits)]
+    if isinstance(out, (list, tuple)):
+        splits = [_split_outputs(x, sizes) for x in out]
+        return [type(out)(parts) for parts in zip(*splits)]
+    if len(out) != sum(sizes):
+        raise BaseException(
+            'Batch dimension of the output {} does not match the batch size {}'.format(len(out), sum(sizes)))
+    return np.split(out, np.cumsum(sizes)[:-1])
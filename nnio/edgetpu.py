@@ -11,6 +11,29 @@ EDGETPU_SHARED_LIB = {
 }[platform.system()]
 
 
+def list_devices():
+    '''
+    Find Edge TPU devices in the system.
+
+    :return: list of device names: ``['TPU:0', 'TPU:1', ...]``
+    '''
+    try:
+        from pycoral.utils.edgetpu import list_edge_tpus
+        return ['TPU:{}'.format(i) for i in range(len(list_edge_tpus()))]
+    except ImportError:
+        pass
+    import tflite_runtime.interpreter as tflite
+    # Try to open devices one by one
+    devices = []
+    while True:
+        try:
+            tflite.load_delegate(EDGETPU_SHARED_LIB, {'device': ':{}'.format(len(devices))})
+        except (ValueError, OSError):
+            break
+        devices.append('TPU:{}'.format(len(devices)))
+    return devices
+
+
 class EdgeTPUModel(_model.Model):
     '''
     This class works with tflite models on CPU and with quantized tflite models on Google Coral Edge TPU.
@@ -20,7 +43,10 @@ class EdgeTPUModel(_model.Model):
     def __init__(
         self,
         model_path: str,
-        device='CPU'
+        device='CPU',
+        zero_copy_outputs=False,
+        num_threads=None,
+        disable_default_delegates=False,
     ):
         '''
         :parameter model_path: URL or path to the tflite model
@@ -28,6 +54,16 @@ class EdgeTPUModel(_model.Model):
             ``CPU`` by default.
             Set ``TPU`` or ``TPU:0`` to use the first EdgeTPU device.
             Set ``TPU:1`` to use the second EdgeTPU device etc.
+        :parameter zero_copy_outputs: ``bool``.
+            If ``True``, ``forward`` returns views of the interpreter output buffers instead of copies.
+            They are valid until the next call of the model, which overwrites them.
+            Models with dynamic tensors (resized while running) are not supported in this mode.
+        :parameter num_threads: ``int`` or ``None``. Number of CPU threads used by the interpreter.
+            By default the interpreter uses one thread.
+        :parameter disable_default_delegates: ``bool``. If ``True``, the operations on CPU run with the builtin kernels
+            without the default delegates of the tflite runtime (XNNPACK in recent versions).
+            It is useful to compare speed with and without XNNPACK.
+            Requires tflite runtime with ``experimental_op_resolver_type`` (version 2.6 or newer).
         '''
         super().__init__()
         # Download file from internet
@@ -35,23 +71,38 @@ class EdgeTPUModel(_model.Model):
             model_path = _utils.file_from_url(model_path, 'models')
         # Create interpreter
         assert device == 'CPU' or device.split(':')[0] == 'TPU' or device[0] == ':'
-        self.interpreter = self._make_interpreter(model_path, device)
+        self.interpreter = self._make_interpreter(model_path, device, num_threads, disable_default_delegates)
         self.interpreter.allocate_tensors()
+        self.zero_copy_outputs = zero_copy_outputs
+        # Tensors are allocated once, so their details do not change
+        self._input_details = self.interpreter.get_input_details()
+        self._output_details = self.interpreter.get_output_details()
+        self._input_tensors = [self.interpreter.tensor(inp['index']) for inp in self._input_details]
+        self._output_tensors = [self.interpreter.tensor(out['index']) for out in self._output_details]
+        # Whether numpy views of the tensors may be held by the user
+        self._views_exported = False
 
     def forward(self, *inputs, return_info=False):
-        assert len(inputs) == self.n_inputs
+        r'''
+        :parameter \*inputs: numpy arrays, inputs to the model.
+            If no inputs are given, the model runs on the data already written to ``input_view``.
+        :parameter return_info: bool, If True, will return inference time
+        :return: numpy array or list of numpy arrays.
+        '''
+        assert len(inputs) in [0, self.n_inputs]
         start = time.time()
         # Put input tensors into model
-        for i in range(self.n_inputs):
-            tensor = self._input_tensor(i)
-            tensor[:, :, :, :] = inputs[i]
-            del tensor
+        for i, x in enumerate(inputs):
+            self._input_tensors[i]()[...] = x
         before_invoke = time.time()
         # Call model
-        self.interpreter.invoke()
+        self._invoke()
         after_invoke = time.time()
         # Get results from the model
-        results = [self._output_tensor(i) for i in range(self.n_outputs)]
+        if self.zero_copy_outputs:
+            results = [tensor() for tensor in self._output_tensors]
+        else:
+            results = [tensor().copy() for tensor in self._output_tensors]
         # Process output a little
         if self.n_outputs == 1:
             results = results[0]
@@ -65,6 +116,23 @@ class EdgeTPUModel(_model.Model):
         else:
             return results
 
+    def input_view(self, i=0):
+        '''
+        Returns numpy array which is a view of the ``i``-th input buffer of the interpreter.
+        Data written to it is used by the next call of the model without inputs.
+        Models with dynamic tensors (resized while running) are not supported with input views.
+
+        Example::
+
+            preproc(image, out=model.input_view())
+            scores = model()
+
+        :parameter i: ``int``. Index of the input.
+        :return: numpy array.
+        '''
+        self._views_exported = True
+        return self._input_tensors[i]()
+
     def get_input_details(self):
         return [
             {
@@ -72,7 +140,7 @@ class EdgeTPUModel(_model.Model):
                 'shape': inp['shape'],
                 'dtype': str(inp['dtype']),
             }
-            for inp in self.interpreter.get_input_details()
+            for inp in self._input_details
         ]
 
     def get_output_details(self):
@@ -82,11 +150,11 @@ class EdgeTPUModel(_model.Model):
                 'shape': inp['shape'],
                 'dtype': str(inp['dtype']),
             }
-            for inp in self.interpreter.get_output_details()
+            for inp in self._output_details
         ]
 
     @staticmethod
-    def _make_interpreter(model_file, device='CPU'):
+    def _make_interpreter(model_file, device='CPU', num_threads=None, disable_default_delegates=False):
         ' Load model and create tflite interpreter '
         try:
             import tflite_runtime.interpreter as tflite
@@ -107,11 +175,19 @@ class EdgeTPUModel(_model.Model):
                 import tensorflow.lite as tflite
             else:
                 raise ImportError
+        # CPU options
+        kwargs = {}
+        if num_threads is not None:
+            kwargs['num_threads'] = num_threads
+        if disable_default_delegates:
+            resolvers = tflite.experimental.OpResolverType if hasattr(tflite, 'experimental') else tflite.OpResolverType
+            kwargs['experimental_op_resolver_type'] = resolvers.BUILTIN_WITHOUT_DEFAULT_DELEGATES
         if device != 'CPU':
             if device == 'TPU':
                 device = 'TPU:0'
             return tflite.Interpreter(
                 model_path=model_file,
+                **kwargs,
                 experimental_delegates=[
                     tflite.load_delegate(
                         EDGETPU_SHARED_LIB,
@@ -122,28 +198,42 @@ class EdgeTPUModel(_model.Model):
                 ])
         else:
             return tflite.Interpreter(
-                model_path=model_file)
+                model_path=model_file,
+                **kwargs)
+
+    def _invoke(self):
+        '''
+        Run the interpreter.
+
+        ``interpreter.invoke()`` refuses to run while numpy views of the tensors exist,
+        because resizing tensors would invalidate them.
+        Views from ``input_view`` and zero-copy outputs may be held by the user,
+        so in these cases the check is skipped. It is safe only if tensors are allocated once and never resized,
+        so models with dynamic tensors are not supported there.
+        '''
+        if not (self.zero_copy_outputs or self._views_exported):
+            self.interpreter.invoke()
+            return
+        # pylint: disable=protected-access
+        self.interpreter._interpreter.Invoke()
 
     def _input_tensor(self, i=0):
         '''
-        Returns input tensor view as function returning numpy array
+        Returns input tensor view as numpy array
         '''
-        tensor_index = self.interpreter.get_input_details()[i]['index']
-        return self.interpreter.tensor(tensor_index)()
+        return self._input_tensors[i]()
 
     def _output_tensor(self, i=0):
-        """Returns output tensor view."""
-        tensor_index = self.interpreter.get_output_details()[i]['index']
-        tensor = self.interpreter.get_tensor(tensor_index)
-        return tensor
+        """Returns copy of output tensor."""
+        return self._output_tensors[i]().copy()
 
     @property
     def n_inputs(self):
         ''' number of input tensors '''
-        return len(self.interpreter.get_input_details())
+        return len(self._input_details)
 
     @property
     def n_outputs(self):
         ''' number of output tensors '''
-        return len(self.interpreter.get_output_details())
+        return len(self._output_details)
 
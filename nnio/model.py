@@ -1,4 +1,10 @@
 import abc
+import asyncio
+import concurrent.futures
+import threading
+
+# Lock for creating executors of models
+_executor_lock = threading.Lock()
 
 
 class Model(abc.ABC):
@@ -8,6 +14,49 @@ class Model(abc.ABC):
     def __call__(self, *args, **kwargs):
         return self.forward(*args, **kwargs)
 
+    def submit(self, *args, **kwargs):
+        r'''
+        Call the model without waiting for the result.
+
+        Backends use their native asynchronous inference where it exists.
+        Otherwise ``forward`` is run in a thread dedicated to this model,
+        so calls made with ``submit`` are executed one by one.
+
+        :parameter \*args: arguments of ``forward``.
+        :parameter \*\*kwargs: keyword arguments of ``forward``.
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        return self._get_executor().submit(self.forward, *args, **kwargs)
+
+    async def forward_async(self, *args, **kwargs):
+        r'''
+        Coroutine version of ``forward``. It does not block the event loop.
+
+        Example::
+
+            boxes = await model.forward_async(image)
+
+        :parameter \*args: arguments of ``forward``.
+        :parameter \*\*kwargs: keyword arguments of ``forward``.
+        :return: result of ``forward``.
+        '''
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    def _get_executor(self, max_workers=1):
+        '''
+        :parameter max_workers: number of threads of the executor.
+        :return: executor created on the first call.
+        '''
+        executor = self.__dict__.get('_executor')
+        if executor is None:
+            with _executor_lock:
+                executor = self.__dict__.get('_executor')
+                if executor is None:
+                    executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers, thread_name_prefix=type(self).__name__)
+                    self._executor = executor
+        return executor
+
     @abc.abstractmethod
     def forward(self, *args, **kwargs):
         r'''
@@ -18,6 +67,14 @@ class Model(abc.ABC):
         :return: numpy array or list of numpy arrays.
         '''
 
+    @property
+    def thread_safe(self):
+        '''
+        ``True`` if ``forward`` can be called from several threads at the same time.
+        See :class:`nnio.ThreadSafeModel`.
+        '''
+        return False
+
     def get_preprocessing(self):
         """
         :return: :class:`nnio.Preprocessing` object.
@@ -1,8 +1,37 @@
+import concurrent.futures
+import os
 import time
+import numpy as np
 
 from . import model as _model
 from . import utils as _utils
 
+# Names of onnxruntime session options
+_EXECUTION_MODES = {
+    'sequential': 'ORT_SEQUENTIAL',
+    'parallel': 'ORT_PARALLEL',
+}
+_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+
+# Numpy data types of onnx tensor types
+_ONNX_DTYPES = {
+    'tensor(float)': np.float32,
+    'tensor(double)': np.float64,
+    'tensor(float16)': np.float16,
+    'tensor(uint8)': np.uint8,
+    'tensor(int8)': np.int8,
+    'tensor(uint16)': np.uint16,
+    'tensor(int16)': np.int16,
+    'tensor(int32)': np.int32,
+    'tensor(int64)': np.int64,
+    'tensor(bool)': np.bool_,
+}
+
 
 class ONNXModel(_model.Model):
     '''
@@ -31,70 +60,386 @@ class ONNXModel(_model.Model):
     '''
     def __init__(
         self,
-        model_path: str,
+        model_path,
+        io_binding=False,
+        intra_op_num_threads=None,
+        inter_op_num_threads=None,
+        execution_mode=None,
+        graph_optimization_level=None,
+        enable_mem_arena=None,
+        enable_mem_pattern=None,
+        cache_optimized=False,
     ):
         '''
 
-        :parameter model_path: URL or path to the .onnx model
+        :parameter model_path: URL or path to the .onnx model.
+            Can also be ``bytes`` of a serialized onnx model.
+        :parameter io_binding: ``bool``.
+            If ``True``, inputs and outputs are bound to the session with onnxruntime IOBinding.
+            Outputs of a fixed shape are written to preallocated arrays,
+            which are reused and overwritten by the next call.
+            In this mode the model must not be called from several threads at once.
+        :parameter intra_op_num_threads: ``int`` or ``None``.
+            Number of threads used to parallelize execution within nodes.
+            Set it when several models share one machine, to avoid oversubscription.
+        :parameter inter_op_num_threads: ``int`` or ``None``.
+            Number of threads used to parallelize execution of the graph across nodes.
+            Has effect only with ``execution_mode='parallel'``.
+        :parameter execution_mode: ``None``, ``'sequential'`` or ``'parallel'``.
+        :parameter graph_optimization_level: ``None``, ``'disable'``, ``'basic'``, ``'extended'`` or ``'all'``.
+        :parameter enable_mem_arena: ``bool`` or ``None``.
+            Use memory arena on CPU.
+        :parameter enable_mem_pattern: ``bool`` or ``None``.
+            Preallocate memory using the pattern of the previous runs.
+        :parameter cache_optimized: ``bool``.
+            If ``True``, the optimized graph is saved to the cache directory.
+            It is loaded instead of optimizing the model again the next time.
+            The cache is keyed by the model contents, the session options, the onnxruntime version
+            and the host, since the optimized graph may be specific to the CPU.
         '''
         super().__init__()
         # Download file from internet
-        if _utils.is_url(model_path):
+        if isinstance(model_path, str) and _utils.is_url(model_path):
             model_path = _utils.file_from_url(model_path, 'models')
+        self.model_path = model_path
+        self.io_binding = io_binding
+        self.session_options = {
+            key: value
+            for key, value in [
+                ('intra_op_num_threads', intra_op_num_threads),
+                ('inter_op_num_threads', inter_op_num_threads),
+                ('execution_mode', execution_mode),
+                ('graph_optimization_level', graph_optimization_level),
+                ('enable_mem_arena', enable_mem_arena),
+                ('enable_mem_pattern', enable_mem_pattern),
+            ]
+            if value is not None
+        }
+        self.cache_optimized = cache_optimized
         # Load model and create inference session
-        self.sess = self._make_interpreter(model_path)
+        self.sess = self._make_interpreter(model_path, self.session_options, cache_optimized)
+        # Resolve input and output details once
+        self._input_details = self._make_details(self.sess.get_inputs())
+        self._output_details = self._make_details(self.sess.get_outputs())
+        self._input_names = [info['name'] for info in self._input_details]
+        self._output_names = [info['name'] for info in self._output_details]
+        if io_binding:
+            self._binding, self._output_buffers = self._make_binding()
+        self._run_async_supported = hasattr(self.sess, 'run_async')
 
     def forward(self, *inputs, return_info=False):
-        assert len(inputs) == len(self.get_input_details())
-        # List output names
-        outputs = [
-            info['name']
-            for info in self.get_output_details()
-        ]
-        # Convert input to a dict
-        inputs = {
-            info['name']: inp
-            for (info, inp) in zip(self.get_input_details(), inputs)
-        }
+        assert len(inputs) == len(self._input_names)
         # Run network and measure time
+        if self.io_binding:
+            start = time.time()
+            results = self._run_binding(inputs)
+            end = time.time()
+        else:
+            start = time.time()
+            results = self.sess.run(self._output_names, dict(zip(self._input_names, inputs)))
+            end = time.time()
+        return self._make_results(results, end - start, return_info)
+
+    def submit(self, *inputs, return_info=False):
+        '''
+        Call the model without waiting for the result.
+
+        Uses ``run_async`` of onnxruntime. It needs at least 2 threads in the intra-op thread pool.
+        If it is not available, or ``io_binding`` is used, the model is run in a dedicated thread.
+
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        assert len(inputs) == len(self._input_names)
+        if self.io_binding or not self._run_async_supported:
+            return super().submit(*inputs, return_info=return_info)
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
         start = time.time()
-        results = self.sess.run(outputs, inputs)
-        end = time.time()
+
+        def callback(results, _user_data, error):
+            end = time.time()
+            if error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(self._make_results(results, end - start, return_info))
+
+        try:
+            self.sess.run_async(self._output_names, dict(zip(self._input_names, inputs)), callback, None)
+        except Exception:
+            # Intra-op thread pool is too small or onnxruntime is too old
+            self._run_async_supported = False
+            return super().submit(*inputs, return_info=return_info)
+        return future
+
+    def _make_results(self, results, invoke_time, return_info):
         # Process output a little
-        if len(outputs) == 1:
+        if len(self._output_names) == 1:
             results = results[0]
         # Return results
         if return_info:
             info = {
-                'invoke_time': end - start,
+                'invoke_time': invoke_time,
             }
             return results, info
         else:
             return results
 
+    @property
+    def thread_safe(self):
+        '''
+        Inference session can be called from several threads, but IOBinding can not.
+        '''
+        return not self.io_binding
+
     def get_input_details(self):
+        return self._input_details
+
+    def get_output_details(self):
+        return self._output_details
+
+    @staticmethod
+    def _make_details(args):
         return [
             {
                 'name': info.name,
                 'shape': info.shape,
                 'dtype': info.type,
             }
-            for info in self.sess.get_inputs()
+            for info in args
         ]
 
-    def get_output_details(self):
+    def _make_binding(self):
+        '''
+        Create IOBinding with preallocated arrays for outputs of a fixed shape.
+        Outputs of a dynamic shape are allocated by onnxruntime.
+        '''
+        binding = self.sess.io_binding()
+        buffers = {}
+        for info in self._output_details:
+            shape = info['shape']
+            dtype = _ONNX_DTYPES.get(info['dtype'])
+            if dtype is not None and all(isinstance(dim, int) for dim in shape):
+                buffer = np.empty(shape, dtype=dtype)
+                binding.bind_output(info['name'], 'cpu', 0, dtype, shape, buffer.ctypes.data)
+                buffers[info['name']] = buffer
+            else:
+                binding.bind_output(info['name'], 'cpu')
+        return binding, buffers
+
+    def _run_binding(self, inputs):
+        '''
+        Run the session with IOBinding.
+        Inputs are bound without copying if they are contiguous.
+        '''
+        for name, inp in zip(self._input_names, inputs):
+            self._binding.bind_cpu_input(name, np.ascontiguousarray(inp))
+        # Arrays allocated for dynamic outputs by the previous call stay bound. Their shape may change
+        for name in self._output_names:
+            if name not in self._output_buffers:
+                self._binding.bind_output(name, 'cpu')
+        self.sess.run_with_iobinding(self._binding)
+        if len(self._output_buffers) == len(self._output_names):
+            return [self._output_buffers[name] for name in self._output_names]
+        # Some outputs were allocated by onnxruntime
+        values = self._binding.get_outputs()
         return [
-            {
-                'name': info.name,
-                'shape': info.shape,
-                'dtype': info.type,
-            }
-            for info in self.sess.get_outputs()
+            self._output_buffers[name] if name in self._output_buffers else value.numpy()
+            for name, value in zip(self._output_names, values)
         ]
 
+    def fuse_preprocessing(self, preprocessing, save_path=None):
+        '''
+        Make a new model with preprocessing done by onnxruntime as a part of the graph.
+
+        The new model takes raw ``uint8`` RGB image of shape ``[H, W, 3]`` instead of the first input.
+        Resizing, channel swapping, normalization and transposition are prepended to the graph as onnx nodes.
+
+        Example::
+
+            model = nnio.ONNXModel('path/to/model.onnx')
+            model = model.fuse_preprocessing(nnio.Preprocessing(
+                resize=(224, 224),
+                dtype='float32',
+                imagenet_scaling=True,
+                channels_first=True,
+                batch_dimension=True,
+            ))
+            class_scores = model(image_rgb)
+
+        Using this method requires onnx package to be installed.
+
+        :parameter preprocessing: :class:`nnio.Preprocessing` object.
+            ``padding=True`` is not supported.
+        :parameter save_path: ``str`` or ``None``.
+            If specified, the new model will also be saved to this path.
+        :return: :class:`nnio.ONNXModel` object.
+        '''
+        import onnx
+        if isinstance(self.model_path, str):
+            model = onnx.load(self.model_path)
+        else:
+            model = onnx.load_from_string(self.model_path)
+        _fuse_preprocessing(model, preprocessing)
+        onnx.checker.check_model(model)
+        if save_path is not None:
+            onnx.save(model, save_path)
+        return ONNXModel(
+            model.SerializeToString(),
+            io_binding=self.io_binding,
+            cache_optimized=self.cache_optimized,
+            **self.session_options
+        )
+
     @staticmethod
-    def _make_interpreter(model_path):
+    def _make_interpreter(model_path, session_options=None, cache_optimized=False):
         'Load model and create inference session'
         import onnxruntime as rt
-        sess = rt.InferenceSession(model_path)
-        return sess
+        session_options = session_options or {}
+        options = rt.SessionOptions()
+        for key, value in session_options.items():
+            if key == 'execution_mode':
+                value = getattr(rt.ExecutionMode, _EXECUTION_MODES[value])
+            elif key == 'graph_optimization_level':
+                value = getattr(rt.GraphOptimizationLevel, _OPTIMIZATION_LEVELS[value])
+            elif key == 'enable_mem_arena':
+                key = 'enable_cpu_mem_arena'
+            setattr(options, key, value)
+        if not cache_optimized:
+            return rt.InferenceSession(model_path, options)
+
+        # Look for the optimized model in cache.
+        # Optimized graph may contain kernels specific to the CPU, so the key includes the host
+        key = _utils.content_hash(model_path, sorted(session_options.items()), rt.__version__, _utils.host_id())
+        cached_path = os.path.join(_utils.cache_dir('onnx_optimized'), key + '.onnx')
+        if os.path.exists(cached_path):
+            # The model is already optimized
+            options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return rt.InferenceSession(cached_path, options)
+        # Optimize the model. Onnxruntime saves it while creating the session
+        def optimize(temp_path):
+            options.optimized_model_filepath = temp_path
+            return rt.InferenceSession(model_path, options)
+        return _utils.atomic_save(cached_path, optimize)
+
+
+def _fuse_preprocessing(model, preprocessing):
+    '''
+    Prepend preprocessing nodes to the graph of the onnx model in place.
+
+    :parameter model: ``onnx.ModelProto``.
+    :parameter preprocessing: :class:`nnio.Preprocessing` object.
+    '''
+    import onnx
+    from onnx import helper, numpy_helper
+
+    if preprocessing.padding and preprocessing.resize is not None:
+        raise BaseException('Preprocessing with padding can not be fused into onnx model')
+    opset = max(
+        [op.version for op in model.opset_import if op.domain in ('', 'ai.onnx')] + [1]
+    )
+    if opset < 11:
+        # Resize node with sizes input appeared in opset 11
+        model.CopyFrom(onnx.version_converter.convert_version(model, 11))
+        opset = 11
+    graph = model.graph
+
+    # Find the first model input. It will be computed by preprocessing nodes
+    initializers = {init.name for init in graph.initializer}
+    inputs = [inp for inp in graph.input if inp.name not in initializers]
+    target = inputs[0]
+    target_dtype = np.dtype(preprocessing.dtype)
+    target_dims = [
+        dim.dim_value if dim.HasField('dim_value') else None
+        for dim in target.type.tensor_type.shape.dim
+    ]
+
+    prefix = 'nnio_preprocessing/'
+    nodes = []
+    new_initializers = []
+
+    def constant(name, value):
+        new_initializers.append(numpy_helper.from_array(np.asarray(value), prefix + name))
+        return prefix + name
+
+    def node(op_type, inputs, output=None, **kwargs):
+        output = output or prefix + '{}_{}'.format(op_type, len(nodes))
+        nodes.append(helper.make_node(op_type, inputs, [output], name=output, **kwargs))
+        return output
+
+    # Size of the image
+    if preprocessing.resize is not None:
+        height, width = preprocessing.resize[1], preprocessing.resize[0]
+        image_dims = ['height', 'width', 3]
+    else:
+        # Take image size from the model input. With to_gray <= 0 there is no channel dimension
+        if preprocessing.channels_first or (preprocessing.to_gray is not None and preprocessing.to_gray <= 0):
+            height, width = target_dims[-2:]
+        else:
+            height, width = target_dims[-3:-1]
+        image_dims = [height or 'height', width or 'width', 3]
+
+    image = prefix + 'image'
+    x = image
+    # Convert colors
+    if preprocessing.bgr:
+        x = node('Gather', [x, constant('bgr_indices', np.array([2, 1, 0], dtype=np.int64))], axis=2)
+    # Resize image
+    if preprocessing.resize is not None:
+        sizes = constant('resize_sizes', np.array([height, width, 3], dtype=np.int64))
+        if opset < 13:
+            roi = constant('resize_roi', np.array([], dtype=np.float32))
+            scales = constant('resize_scales', np.array([], dtype=np.float32))
+        else:
+            roi = scales = ''
+        x = node(
+            'Resize', [x, roi, scales, sizes],
+            mode='linear',
+            coordinate_transformation_mode='half_pixel',
+        )
+    # Shift and scale
+    normalize = (
+        preprocessing._means is not None
+        or preprocessing._scales is not None
+        or preprocessing.to_gray is not None
+    )
+    compute_dtype = target_dtype
+    if normalize and not np.issubdtype(target_dtype, np.floating):
+        compute_dtype = np.dtype('float32')
+    x = node('Cast', [x], to=helper.np_dtype_to_tensor_dtype(compute_dtype))
+    if preprocessing._means is not None:
+        means = np.reshape(preprocessing._means, -1).astype(compute_dtype)
+        x = node('Sub', [x, constant('means', means)])
+    if preprocessing._scales is not None:
+        scales = np.reshape(preprocessing._scales, -1).astype(compute_dtype)
+        x = node('Mul', [x, constant('scales', scales)])
+    # Convert to grayscale
+    if preprocessing.to_gray is not None:
+        keepdims = int(preprocessing.to_gray > 0)
+        if opset < 18:
+            x = node('ReduceMean', [x], axes=[2], keepdims=keepdims)
+        else:
+            x = node('ReduceMean', [x, constant('gray_axes', np.array([2], dtype=np.int64))], keepdims=keepdims)
+        if preprocessing.to_gray > 1:
+            repeats = np.array([1, 1, preprocessing.to_gray], dtype=np.int64)
+            x = node('Tile', [x, constant('gray_repeats', repeats)])
+    if compute_dtype != target_dtype:
+        x = node('Cast', [x], to=helper.np_dtype_to_tensor_dtype(target_dtype))
+    # Change shape
+    if preprocessing.channels_first:
+        x = node('Transpose', [x], perm=[2, 0, 1])
+    if preprocessing.batch_dimension:
+        if opset < 13:
+            x = node('Unsqueeze', [x], axes=[0])
+        else:
+            x = node('Unsqueeze', [x, constant('batch_axes', np.array([0], dtype=np.int64))])
+    node('Identity', [x], output=target.name)
+
+    # Replace the model input with the raw image
+    new_input = helper.make_tensor_value_info(image, onnx.TensorProto.UINT8, image_dims)
+    position = list(graph.input).index(target)
+    graph.input.remove(target)
+    graph.input.insert(position, new_input)
+    graph.initializer.extend(new_initializers)
+    old_nodes = list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes + old_nodes)
@@ -1,4 +1,10 @@
+import collections
+import concurrent.futures
+import functools
+import os
+import queue
 import time
+import weakref
 
 from . import model as _model
 from . import utils as _utils
@@ -15,6 +21,11 @@ class OpenVINOModel(_model.Model):
         model_bin: str,
         model_xml: str,
         device='CPU',
+        num_requests=1,
+        num_streams=None,
+        performance_hint=None,
+        cache_compiled=False,
+        temperature_interval=1.0,
     ):
         '''
         :parameter model_bin: URL or path to the openvino binary model file
@@ -24,6 +35,23 @@ class OpenVINOModel(_model.Model):
             ``CPU``, ``GPU``, ``MYRIAD``
             If there are multiple devices in your system, you can use indeces:
             ``MYRIAD:0`` but it is not recommended since Intel automatically chooses a free device.
+        :parameter num_requests: ``int``. Number of infer requests which can run at the same time
+            (see ``submit`` and ``map``).
+            If ``0``, openvino chooses the optimal number for the device.
+        :parameter num_streams: ``int`` or ``'AUTO'``. Number of throughput streams on ``CPU`` or ``GPU``.
+            Each stream runs one infer request on its own part of the cores.
+            Use together with ``num_requests`` not less than ``num_streams``.
+        :parameter performance_hint: ``'LATENCY'`` or ``'THROUGHPUT'``.
+            Let openvino choose the device config for low latency or for high throughput.
+        :parameter cache_compiled: ``bool``.
+            If ``True``, the model compiled for the device is saved to the cache directory.
+            It is loaded instead of compiling the model again the next time.
+            The cache is keyed by the model files, the device, the config and the openvino version.
+            Loading time and whether the cache was used are reported in ``load_info``
+            and in the info dictionary returned with ``return_info=True``.
+        :parameter temperature_interval: ``float``. Time in seconds between temperature measurements on ``MYRIAD``.
+            Temperature is measured in a background thread.
+            ``forward`` returns the latest measured value in ``info['temperature']``.
         '''
         super().__init__()
 
@@ -33,46 +61,226 @@ class OpenVINOModel(_model.Model):
         if _utils.is_url(model_xml):
             model_xml = _utils.file_from_url(model_xml, 'models')
 
+        # Device config
+        config = {}
+        if num_streams is not None:
+            device_type = device.split(':')[0].split('.')[0]
+            if device_type not in ['CPU', 'GPU']:
+                raise BaseException('num_streams is supported only on CPU and GPU, got device {}'.format(device))
+            if num_streams == 'AUTO':
+                num_streams = '{}_THROUGHPUT_AUTO'.format(device_type)
+            config['{}_THROUGHPUT_STREAMS'.format(device_type)] = str(num_streams)
+        if performance_hint is not None:
+            if performance_hint not in ['LATENCY', 'THROUGHPUT']:
+                raise BaseException('performance_hint must be "LATENCY" or "THROUGHPUT", got {}'.format(performance_hint))
+            config['PERFORMANCE_HINT'] = performance_hint
+
         # Create interpreter
-        self.ie, self.net, self.device = self._make_interpreter(model_xml, model_bin, device)
+        start = time.time()
+        self.ie, self.net, self.device, cached = self._make_interpreter(
+            model_xml, model_bin, device, config=config, num_requests=num_requests,
+            cache_compiled=cache_compiled)
+        self.load_info = {
+            'load_time': time.time() - start,
+            'cached': cached,
+        }
+
+        # Remember names of inputs and outputs
+        self._input_names = list(self.net.input_info.keys())
+        self._output_names = list(self.net.outputs.keys())
+
+        # Infer requests which are not busy
+        self._idle_requests = queue.Queue()
+        for request_id in range(len(self.net.requests)):
+            self._idle_requests.put(request_id)
+
+        # Measure temperature in background
+        self._temperature_sampler = None
+        if self.device.startswith('MYRIAD.'):
+            self._temperature_sampler = _utils.TelemetrySampler(
+                functools.partial(self.ie.get_metric, metric_name='DEVICE_THERMAL', device_name=self.device),
+                interval=temperature_interval,
+                callback=functools.partial(_log_temperature, self.device),
+            )
+            weakref.finalize(self, self._temperature_sampler.stop)
+
+    @property
+    def thread_safe(self):
+        '''
+        ``True`` if there are several infer requests. Each call takes its own infer request,
+        so with a single request the callers would wait for each other.
+        '''
+        return self.num_requests > 1
 
-    def forward(self, inputs, return_info=False):
+    @property
+    def num_requests(self):
+        '''
+        Number of infer requests created on the device.
+        '''
+        return len(self.net.requests)
+
+    def forward(self, *inputs, return_info=False):
         r'''
-        :parameter inputs: numpy array, input to the model
-        :parameter return_info: bool, If True, will return inference time
-        :return: numpy array or list of numpy arrays.
+        :parameter \*inputs: numpy arrays, inputs to the model in the order of ``get_input_details``
+        :parameter return_info: bool, If True, will return inference time,
+            ``load_time`` and ``cached`` (see ``cache_compiled``).
+        :return: numpy array or dictionary of numpy arrays.
         '''
-        # Find name of the input to the model
-        input_name = list(self.net.input_info.keys())[0]
+        feed = self._make_feed(inputs)
         # Call model
+        request_id = self._idle_requests.get()
+        try:
+            request = self.net.requests[request_id]
+            start = time.time()
+            request.infer(feed)
+            end = time.time()
+            out = self._get_outputs(request)
+        finally:
+            self._idle_requests.put(request_id)
+        info = {
+            'invoke_time': end - start,
+        }
+        self._add_info(info)
+        return self._make_results(out, info, return_info)
+
+    def submit(self, *inputs, return_info=False):
+        '''
+        Call the model without waiting for the result.
+
+        Uses asynchronous openvino infer requests.
+        Waits only if all infer requests are busy.
+
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        feed = self._make_feed(inputs)
+        request_id = self._idle_requests.get()
+        request = self.net.requests[request_id]
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
         start = time.time()
-        out = self.net.infer({input_name: inputs})
-        end = time.time()
+
+        def callback(status, _user_data):
+            end = time.time()
+            try:
+                if status != 0:
+                    raise BaseException('Inference failed with status {}'.format(status))
+                out = self._get_outputs(request)
+                info = {
+                    'invoke_time': end - start,
+                }
+                self._add_info(info)
+                future.set_result(self._make_results(out, info, return_info))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._idle_requests.put(request_id)
+
+        try:
+            request.set_completion_callback(callback)
+            request.async_infer(feed)
+        except BaseException:
+            # The callback will not be called, so the request is free
+            self._idle_requests.put(request_id)
+            raise
+        return future
+
+    def map(self, inputs, return_info=False):
+        '''
+        Run the model on a sequence of inputs, keeping all infer requests busy.
+
+        Example::
+
+            model = nnio.OpenVINOModel(..., num_requests=4, num_streams=4)
+            for out in model.map(preproc(image) for image in images):
+                ...
+
+        :parameter inputs: iterable of numpy arrays (or tuples of numpy arrays for models with several inputs).
+        :parameter return_info: bool. Same as in ``forward``.
+        :return: generator of results of ``forward`` in the order of ``inputs``.
+        '''
+        futures = collections.deque()
+        try:
+            for x in inputs:
+                if not isinstance(x, (tuple, list)):
+                    x = (x,)
+                if len(futures) >= self.num_requests:
+                    yield futures.popleft().result()
+                futures.append(self.submit(*x, return_info=return_info))
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # Wait for the requests which are still running
+            for future in futures:
+                future.exception()
+
+    def get_input_details(self):
+        '''
+        :return: list of dictionaries with ``name``, ``shape`` and ``dtype`` of the inputs.
+        '''
+        return [
+            {
+                'name': name,
+                'shape': list(info.tensor_desc.dims),
+                'dtype': info.precision,
+            }
+            for name, info in self.net.input_info.items()
+        ]
+
+    def get_output_details(self):
+        '''
+        :return: list of dictionaries with ``name``, ``shape`` and ``dtype`` of the outputs.
+        '''
+        return [
+            {
+                'name': name,
+                'shape': list(data.shape),
+                'dtype': data.precision,
+            }
+            for name, data in self.net.outputs.items()
+        ]
+
+    def _make_feed(self, inputs):
+        ''' Map inputs to the names of inputs of the network '''
+        if len(inputs) != len(self._input_names):
+            raise BaseException('Model has {} inputs ({}), got {}'.format(
+                len(self._input_names), ', '.join(self._input_names), len(inputs)))
+        return dict(zip(self._input_names, inputs))
+
+    def _add_info(self, info):
+        ''' Put loading time and the latest measured temperature into info '''
+        info.update(self.load_info)
+        if self._temperature_sampler is not None:
+            info['temperature'] = self._temperature_sampler.latest
+
+    @staticmethod
+    def _get_outputs(request):
+        ''' Copy outputs out of the infer request, since it will be reused '''
+        return {
+            name: blob.buffer.copy()
+            for name, blob in request.output_blobs.items()
+        }
+
+    @staticmethod
+    def _make_results(out, info, return_info):
         # Process output a little
         if len(out.keys()) == 1:
             out = out[list(out.keys())[0]]
-        # Measure temperature
-        temperature = None
-        if self.device.startswith('MYRIAD.'):
-            temperature = self.ie.get_metric(metric_name="DEVICE_THERMAL", device_name=self.device)
-            if _utils.LOG_TEMPERATURE:
-                _utils.log_temperature(self.device, temperature)
         # Return results
         if return_info:
-            info = {
-                'invoke_time': end - start,
-            }
-            if temperature is not None:
-                info['temperature'] = temperature
             return out, info
         else:
             return out
 
     @staticmethod
-    def _make_interpreter(model_xml, model_bin, device):
-        'Load model and create openvino interpreter'
+    def _make_interpreter(model_xml, model_bin, device, config=None, num_requests=1, cache_compiled=False):
+        '''
+        Load model and create openvino interpreter.
+
+        :return: ``(ie, net, device, cached)``, where ``cached`` tells if the compiled model was loaded from cache.
+        '''
+        config = config or {}
         try:
-            from openvino.inference_engine import IECore
+            from openvino.inference_engine import IECore, get_version
         except ImportError:
             print('''
             Warning: openvino is not installed.
@@ -92,8 +300,40 @@ class OpenVINOModel(_model.Model):
             if len(myriads) <= idx:
                 raise BaseException('Cannot find out which device is {}\nAvailable devices: {}'.format(device, ie.available_devices))
             device = myriads[idx]
-        # Load model on device
-        net = ie.read_network(model_xml, model_bin)
         print('Loading model to:', device)
-        net = ie.load_network(net, device)
-        return ie, net, device
+        if not cache_compiled:
+            net = ie.read_network(model_xml, model_bin)
+            net = ie.load_network(net, device, config=config, num_requests=num_requests)
+            return ie, net, device, False
+
+        # Compiled model does not depend on the index of the device
+        device_type = device.split(':')[0].split('.')[0]
+        key = _utils.content_hash(model_xml, model_bin, device_type, sorted(config.items()), get_version())
+        # Plugins which do not list the metric raise an error when it is requested
+        export_supported = (
+            'IMPORT_EXPORT_SUPPORT' in ie.get_metric(device_type, 'SUPPORTED_METRICS')
+            and ie.get_metric(device_type, 'IMPORT_EXPORT_SUPPORT')
+        )
+        if not export_supported:
+            # Let openvino cache the compiled model by itself
+            cache_path = _utils.cache_dir('openvino_compiled', key)
+            cached = len(os.listdir(cache_path)) > 0
+            ie.set_config({'CACHE_DIR': cache_path}, device_type)
+            net = ie.read_network(model_xml, model_bin)
+            net = ie.load_network(net, device, config=config, num_requests=num_requests)
+            return ie, net, device, cached
+
+        # Look for the exported model in cache
+        cached_path = os.path.join(_utils.cache_dir('openvino_compiled'), key + '.blob')
+        if os.path.exists(cached_path):
+            net = ie.import_network(cached_path, device, config=config, num_requests=num_requests)
+            return ie, net, device, True
+        net = ie.read_network(model_xml, model_bin)
+        net = ie.load_network(net, device, config=config, num_requests=num_requests)
+        _utils.atomic_save(cached_path, net.export)
+        return ie, net, device, False
+
+
+def _log_temperature(device, temperature):
+    if _utils.LOG_TEMPERATURE:
+        _utils.log_temperature(device, temperature)
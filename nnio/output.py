@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 
 
 class DetectionBox:
@@ -91,3 +92,73 @@ class DetectionBox:
             self.score
         )
         return s
+
+
+class LetterboxTransform:
+    '''
+    Affine transform of relative coordinates from the preprocessed image to the original image.
+
+    It is returned by :meth:`nnio.Preprocessing.get_transform`.
+    '''
+    def __init__(
+        self,
+        scale_x=1.0,
+        scale_y=1.0,
+        offset_x=0.0,
+        offset_y=0.0,
+    ):
+        '''
+        Original coordinates are computed as ``x * scale_x + offset_x`` and ``y * scale_y + offset_y``.
+
+        :parameter scale_x: ``float``.
+        :parameter scale_y: ``float``.
+        :parameter offset_x: ``float``.
+        :parameter offset_y: ``float``.
+        '''
+        self.scale = np.array([scale_x, scale_y, scale_x, scale_y])
+        self.offset = np.array([offset_x, offset_y, offset_x, offset_y])
+
+    def __call__(self, boxes, clip=True):
+        '''
+        Transform boxes.
+
+        :parameter boxes: list of :class:`nnio.DetectionBox` or np.ndarray of shape ``[..., 4]``.
+            Array must contain ``x_min, y_min, x_max, y_max`` in the last dimension.
+        :parameter clip: ``bool``.
+            If ``True``, clip coordinates to the range ``[0, 1]``.
+        :return: transformed boxes of the same type as ``boxes``.
+            New objects are created, the input is not modified.
+        '''
+        is_array = isinstance(boxes, np.ndarray)
+        coords = boxes_to_array(boxes)
+        coords = coords * self.scale + self.offset
+        if clip:
+            coords = np.clip(coords, 0, 1)
+        if is_array:
+            return coords
+        return [
+            DetectionBox(*coord, label=box.label, score=box.score)
+            for coord, box in zip(coords.tolist(), boxes)
+        ]
+
+    def __str__(self):
+        template = 'nnio.LetterboxTransform(scale_x={}, scale_y={}, offset_x={}, offset_y={})'
+        return template.format(self.scale[0], self.scale[1], self.offset[0], self.offset[1])
+
+
+def boxes_to_array(boxes):
+    '''
+    Convert boxes to numpy array.
+
+    :parameter boxes: list of :class:`nnio.DetectionBox` or array-like of shape ``[..., 4]``.
+    :return: np.ndarray of shape ``[..., 4]`` with ``x_min, y_min, x_max, y_max`` in the last dimension.
+    '''
+    if isinstance(boxes, np.ndarray):
+        return boxes
+    boxes = list(boxes)
+    if len(boxes) > 0 and isinstance(boxes[0], DetectionBox):
+        boxes = [
+            [box.x_min, box.y_min, box.x_max, box.y_max]
+            for box in boxes
+        ]
+    return np.array(boxes, dtype=np.float64).reshape(-1, 4)
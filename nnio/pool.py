@@ -0,0 +1,310 @@
+import collections
+import concurrent.futures
+import itertools
+import queue
+import threading
+import weakref
+
+from . import model as _model
+
+
+class DevicePool(_model.Model):
+    '''
+    Runs copies of a model on several devices at the same time.
+
+    A model is created for every device. Each device has a thread with its own queue of calls.
+    Each call goes to the device with the fewest queued calls,
+    so several frames are processed at the same time.
+
+    Usage example::
+
+        # Load the model on every Edge TPU in the system
+        pool = nnio.DevicePool(
+            lambda device: nnio.zoo.edgetpu.detection.SSDMobileNet(device=device),
+            devices='TPU:*',
+        )
+
+        # Process a video with all devices, keeping the order of frames
+        for boxes in pool.map(frames):
+            ...
+
+        # Or call from many threads
+        boxes = pool(frame)
+
+    For testing without accelerators, several CPU models can be used::
+
+        pool = nnio.DevicePool(factory, devices=['CPU'] * 4)
+    '''
+    def __init__(
+        self,
+        factory,
+        devices='TPU:*',
+    ):
+        '''
+        :parameter factory: function ``factory(device)`` which returns a :class:`nnio.Model` loaded on ``device``.
+        :parameter devices: list of device names passed to ``factory``.
+            ``'TPU:*'`` means all Edge TPU devices found in the system.
+        '''
+        super().__init__()
+        if devices == 'TPU:*':
+            from . import edgetpu as _edgetpu
+            devices = _edgetpu.list_devices()
+        if isinstance(devices, str):
+            devices = [devices]
+        if len(devices) == 0:
+            raise BaseException('No devices found for DevicePool')
+        self.devices = list(devices)
+        self.models = [factory(device) for device in self.devices]
+
+        self._queues = [queue.Queue() for _ in self.devices]
+        # Number of calls queued or running on each device
+        self._pending = [0] * len(self.devices)
+        self._lock = threading.Lock()
+        self._order = itertools.cycle(range(len(self.devices)))
+        self._closed = False
+        # The threads do not hold a reference to self, so the pool can be garbage-collected.
+        # Then the threads are stopped
+        self._workers = [
+            threading.Thread(
+                target=_work,
+                args=(self.models[i], self._queues[i], self._pending, i, self._lock),
+                name='{}-{}'.format(type(self).__name__, device),
+                daemon=True,
+            )
+            for i, device in enumerate(self.devices)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._finalizer = weakref.finalize(self, _stop_workers, self._queues)
+
+    def forward(self, *args, **kwargs):
+        r'''
+        Call the model on the least busy device and wait for the result.
+
+        :parameter \*args: arguments of ``forward`` of the model.
+        :parameter \*\*kwargs: keyword arguments of ``forward`` of the model.
+        :return: result of ``forward`` of the model.
+        '''
+        return self.submit(*args, **kwargs).result()
+
+    def submit(self, *args, **kwargs):
+        r'''
+        Put a call into the queue of the least busy device.
+
+        :parameter \*args: arguments of ``forward`` of the model.
+        :parameter \*\*kwargs: keyword arguments of ``forward`` of the model.
+        :return: ``concurrent.futures.Future`` with the result.
+        '''
+        future = concurrent.futures.Future()
+        with self._lock:
+            # Calls are not put into the queues after they are closed
+            if self._closed:
+                raise BaseException('DevicePool is closed')
+            # Start looking from the next device in turn, so that idle devices are used evenly
+            start = next(self._order)
+            order = [(start + k) % len(self.devices) for k in range(len(self.devices))]
+            idx = min(order, key=lambda i: self._pending[i])
+            self._pending[idx] += 1
+            self._queues[idx].put((future, args, kwargs))
+        return future
+
+    def map(self, inputs, in_flight=2, **kwargs):
+        r'''
+        Run the model on a sequence of inputs using all devices.
+
+        :parameter inputs: iterable of inputs (or tuples of inputs) to the model.
+        :parameter in_flight: ``int``. Number of calls queued on each device.
+        :parameter \*\*kwargs: keyword arguments of ``forward`` of the model.
+        :return: generator of results in the order of ``inputs``.
+        '''
+        futures = collections.deque()
+        try:
+            for x in inputs:
+                if not isinstance(x, (tuple, list)):
+                    x = (x,)
+                if len(futures) >= in_flight * len(self.devices):
+                    yield futures.popleft().result()
+                futures.append(self.submit(*x, **kwargs))
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # Do not run the calls which are not needed anymore
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        '''
+        Stop the threads after processing the calls already in the queues.
+        '''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._finalizer()
+        for worker in self._workers:
+            worker.join()
+
+    def get_preprocessing(self):
+        return self.models[0].get_preprocessing()
+
+    def get_input_details(self):
+        return self.models[0].get_input_details()
+
+    def get_output_details(self):
+        return self.models[0].get_output_details()
+
+    def __str__(self):
+        return 'DevicePool({})'.format(', '.join(self.devices))
+
+
+def _work(model, requests, pending, i, lock):
+    '''
+    Loop of the thread of the ``i``-th device
+    '''
+    while True:
+        item = requests.get()
+        if item is None:
+            break
+        future, args, kwargs = item
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(model.forward(*args, **kwargs))
+                except BaseException as e: # pylint: disable=broad-except
+                    future.set_exception(e)
+        finally:
+            with lock:
+                pending[i] -= 1
+
+
+def _stop_workers(queues):
+    for q in queues:
+        q.put(None)
+
+
+class ThreadSafeModel(_model.Model):
+    '''
+    Model which can be called from several threads at the same time.
+
+    Keeps a pool of model instances and gives one of them to each caller.
+    If the model is thread-safe (see ``Model.thread_safe``), one instance is shared by all callers,
+    so the weights are loaded only once.
+    Otherwise ``factory`` is called to create ``replicas`` instances.
+
+    Usage example::
+
+        model = nnio.ThreadSafeModel(
+            lambda: nnio.EdgeTPUModel('path/to/model.tflite'),
+            replicas=4,
+            timeout=1.0,
+        )
+
+        # In request handlers of a multi-threaded web server
+        scores = model(image)
+
+        # Several calls with the same instance
+        with model.acquire() as replica:
+            scores = replica(image)
+            details = replica.get_output_details()
+    '''
+    def __init__(
+        self,
+        factory,
+        replicas=2,
+        timeout=None,
+    ):
+        '''
+        :parameter factory: function without arguments which returns :class:`nnio.Model`,
+            or :class:`nnio.Model` object.
+            An object can be replicated only if it is thread-safe.
+        :parameter replicas: ``int``. Maximal number of callers using the model at the same time.
+        :parameter timeout: ``float`` or ``None``. Maximal time in seconds to wait for a free instance.
+            ``TimeoutError`` is raised after that. ``None`` means waiting forever.
+        '''
+        super().__init__()
+        self.replicas = replicas
+        self.timeout = timeout
+
+        if isinstance(factory, _model.Model):
+            first = factory
+            factory = None
+        else:
+            first = factory()
+        if first.thread_safe:
+            self.models = [first]
+        elif factory is not None:
+            self.models = [first] + [factory() for _ in range(replicas - 1)]
+        elif replicas == 1:
+            self.models = [first]
+        else:
+            raise BaseException(
+                '{} is not thread-safe. Pass a function creating it to make {} replicas'.format(
+                    type(first).__name__, replicas))
+
+        # Free instances. A shared instance is put several times
+        self._free = queue.Queue()
+        for i in range(replicas):
+            self._free.put(self.models[i % len(self.models)])
+
+    @property
+    def thread_safe(self):
+        return True
+
+    def forward(self, *args, **kwargs):
+        r'''
+        Call ``forward`` of a free instance of the model.
+
+        :parameter \*args: arguments of ``forward`` of the model.
+        :parameter \*\*kwargs: keyword arguments of ``forward`` of the model.
+        :return: result of ``forward`` of the model.
+        '''
+        with self.acquire() as model:
+            return model.forward(*args, **kwargs)
+
+    def submit(self, *args, **kwargs):
+        r'''
+        Call the model without waiting for the result.
+        Up to ``replicas`` calls are processed at the same time.
+
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        return self._get_executor(self.replicas).submit(self.forward, *args, **kwargs)
+
+    def acquire(self):
+        '''
+        Take a free instance of the model. Waits not longer than ``timeout``.
+
+        :return: context manager which gives the instance and returns it to the pool on exit.
+        '''
+        try:
+            model = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError('No free model instance in {} seconds'.format(self.timeout)) from None
+        return _Replica(model, self._free)
+
+    def get_preprocessing(self):
+        return self.models[0].get_preprocessing()
+
+    def get_input_details(self):
+        return self.models[0].get_input_details()
+
+    def get_output_details(self):
+        return self.models[0].get_output_details()
+
+    def __str__(self):
+        return 'ThreadSafeModel({}, replicas={})'.format(self.models[0], self.replicas)
+
+
+class _Replica:
+    '''
+    Context manager returning an instance to the pool of ThreadSafeModel
+    '''
+    def __init__(self, model, free):
+        self.model = model
+        self.free = free
+
+    def __enter__(self):
+        return self.model
+
+    def __exit__(self, *args):
+        self.free.put(self.model)
@@ -1,10 +1,40 @@
+import collections
+import concurrent.futures
 import cv2
+import functools
+import io
+import itertools
 import numpy as np
 import os
+import threading
 
 from . import model as _model
+from . import output as _output
 from . import utils as _utils
 
+# Flags for decoding images at reduced resolution
+# pylint: disable=no-member
+_REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Weights of channels for grayscale conversion
+_GRAY_WEIGHTS = np.full([1, 3], 1 / 3)
+# For uint8 images the average is rounded down, like in ``astype``
+_GRAY_WEIGHTS_UINT8 = np.array([[1 / 3, 1 / 3, 1 / 3, -0.499]])
+
+# Data types of normalized images which can be resized by cv2
+_CV2_RESIZE_DTYPES = {np.dtype('float32'), np.dtype('float64')}
+
+# Data types of lookup tables supported by cv2.LUT
+_CV2_LUT_DTYPES = {
+    np.dtype(dtype)
+    for dtype in ['uint8', 'int8', 'uint16', 'int16', 'int32', 'float16', 'float32', 'float64']
+}
+
 class Preprocessing(_model.Model):
     '''
     This class provides functionality of the image preprocessing.
@@ -30,6 +60,12 @@ class Preprocessing(_model.Model):
         # Or use to read image from the web
         image_preprocessed = preproc('http://www.example.com/image.png')
 
+        # Or use to decode image file contents
+        image_preprocessed = preproc(jpeg_bytes)
+
+        # Preprocess several images into one batch of shape [N, C, H, W]
+        batch = preproc.batch([image_1, image_2, 'path/to/image.png'])
+
     Object of this type is returned every time you call ``get_preprocessing()`` method of any model from :ref:`nnio.zoo`.
     '''
     def __init__(
@@ -125,32 +161,308 @@ class Preprocessing(_model.Model):
                 self._scales = 1 / 255
             if self._means is not None:
                 self._means = self._means * 255
+        self._lut = self._make_lut()
+        # Arrays for intermediate results, reused between calls
+        self._buffers = threading.local()
 
-    def forward(self, image, return_original=False):
+    def forward(self, image, return_original=False, out=None):
         '''
         Preprocess the image.
 
-        :parameter image: np.ndarray of type ``uint8`` or ``str``
+        :parameter image: np.ndarray of type ``uint8``, ``str`` or ``bytes``
             RGB image
-            If ``str``, it will be concerned as image path.
+            If ``str``, it will be concerned as image path or URL.
+            URLs are downloaded into memory, without writing to disk.
+            If ``bytes``, it will be concerned as encoded image file (e.g. jpeg or png).
         :parameter return_original: ``bool``.
-            If ``True``, will return tuple of ``(preprocessed_image, original_image)``
+            If ``True``, will return tuple of ``(preprocessed_image, original_image)``.
+            If ``image`` is a numpy array, it is returned as the original image without copying.
+            Otherwise the original image is decoded at full resolution.
+        :parameter out: ``None`` or np.ndarray.
+            Array to write the result into. Its shape and data type must match the output of the preprocessing.
+            Intermediate arrays are reused between calls,
+            so with ``out`` specified preprocessing of a video stream does not allocate memory for every frame.
         '''
         # Read image
-        if isinstance(image, str):
-            image = self._read_image(image)
+        if not isinstance(image, np.ndarray):
+            # The original image is returned to the caller, so it is not decoded at reduced resolution
+            resize = None if return_original else self.resize
+            image = self._read_image(image, resize, self.padding)
+
+        # Prepare output array
+        shape = self._output_shape(image)
+        if self.batch_dimension:
+            shape = (1,) + shape
+        out = self._check_out(out, shape)
+
+        self._preprocess(image, out[0] if self.batch_dimension else out)
+
         if return_original:
-            orig_image = image.copy()
+            return out, image
+        else:
+            return out
+
+    def batch(self, images, out=None):
+        '''
+        Preprocess a list of images into a single batch.
+
+        All images are written into one preallocated array,
+        so there is no need to call ``np.concatenate`` on the results of ``forward``.
+        The batch dimension is always added, regardless of ``batch_dimension``.
+
+        :parameter images: list of np.ndarray of type ``uint8``, ``str`` or ``bytes``.
+            RGB images, paths, URLs or encoded image files. See ``forward``.
+            If ``resize`` is ``None``, all images must have the same size.
+        :parameter out: ``None`` or np.ndarray.
+            Array to write the batch into. See ``forward``.
+        :return: np.ndarray of shape ``[N, C, H, W]`` if ``channels_first`` is ``True``,
+            else ``[N, H, W, C]``.
+        '''
+        images = list(images)
+        if len(images) == 0:
+            raise BaseException('Cannot make a batch from an empty list of images')
+        for i, image in enumerate(images):
+            if not isinstance(image, np.ndarray):
+                image = self._read_image(image, self.resize, self.padding)
+            shape = self._output_shape(image)
+            # Allocate the batch when the shape of an image is known
+            if i == 0:
+                out = self._check_out(out, (len(images),) + shape)
+            elif shape != out.shape[1:]:
+                raise BaseException('All images in a batch must have the same shape after preprocessing. Got {} and {}'.format(
+                    out.shape[1:], shape))
+            self._preprocess(image, out[i])
+        return out
+
+    def crops(self, image, boxes, expand=False, out=None):
+        '''
+        Crop several regions from one image and preprocess them into a single batch.
+
+        It is useful to pass all objects found by a detector to another model at once.
+        Crops keep their aspect ratio if ``padding`` is ``True``.
+
+        Example::
+
+            boxes = [box for box in detector(detector_preproc(image_rgb)) if box.label == 'person']
+            batch = reid_preproc.crops(image_rgb, boxes)
+            vectors = reid(batch)
+
+        :parameter image: np.ndarray of type ``uint8``, ``str`` or ``bytes``.
+            RGB image. See ``forward``.
+        :parameter boxes: list of :class:`nnio.DetectionBox` or array-like of shape ``[N, 4]``.
+            Relative coordinates ``x_min, y_min, x_max, y_max`` of the regions.
+        :parameter expand: ``bool``.
+            If ``True``, expand each region around its center to the aspect ratio of ``resize``,
+            so that the crop contains more context instead of padding.
+        :parameter out: ``None`` or np.ndarray.
+            Array to write the batch into. See ``forward``.
+        :return: np.ndarray of shape ``[N, C, H, W]`` if ``channels_first`` is ``True``,
+            else ``[N, H, W, C]``.
+        '''
+        if self.resize is None:
+            raise BaseException('Crops can be preprocessed into a batch only if resize is specified')
+        if not isinstance(image, np.ndarray):
+            image = self._read_image(image)
+        coords = _output.boxes_to_array(boxes)
+        out = self._check_out(out, (len(coords),) + self._output_shape(image))
+        height, width = image.shape[:2]
+        # Convert to pixel coordinates
+        coords = coords * [width, height, width, height]
+        if expand:
+            center_x = (coords[:, 0] + coords[:, 2]) / 2
+            center_y = (coords[:, 1] + coords[:, 3]) / 2
+            box_width = coords[:, 2] - coords[:, 0]
+            box_height = coords[:, 3] - coords[:, 1]
+            aspect = self.resize[0] / self.resize[1]
+            box_width, box_height = (
+                np.maximum(box_width, box_height * aspect),
+                np.maximum(box_height, box_width / aspect),
+            )
+            coords = np.stack([
+                center_x - box_width / 2,
+                center_y - box_height / 2,
+                center_x + box_width / 2,
+                center_y + box_height / 2,
+            ], axis=1)
+        coords = coords.astype(int)
+        # Every crop is at least one pixel inside the image
+        coords[:, [0, 1]] = np.clip(coords[:, [0, 1]], 0, [width - 1, height - 1])
+        coords[:, [2, 3]] = np.clip(coords[:, [2, 3]], coords[:, [0, 1]] + 1, [width, height])
+        for i, (x_min, y_min, x_max, y_max) in enumerate(coords):
+            self._preprocess(image[y_min: y_max, x_min: x_max], out[i])
+        return out
+
+    def map(self, images, workers=None, batch_size=None, prefetch=None):
+        '''
+        Preprocess images in a pool of threads.
+
+        This is a generator. It yields preprocessed images in the same order as they come in ``images``.
+        Reading, resizing and normalization release the GIL, so the work is spread across all cores.
+
+        Example::
+
+            for batch in preproc.map(paths, workers=4, batch_size=16):
+                results = model(batch)
+
+        :parameter images: iterable of np.ndarray of type ``uint8``, ``str`` or ``bytes``.
+            RGB images, paths, URLs or encoded image files. See ``forward``.
+            It is consumed lazily.
+            URLs are downloaded by the worker threads,
+            so the next ``prefetch`` images are fetched concurrently over pooled connections.
+        :parameter workers: ``int`` or ``None``.
+            Number of threads. By default, number of CPU cores.
+        :parameter batch_size: ``int`` or ``None``.
+            If ``None``, yield results of ``forward`` one by one.
+            Else yield batches of up to ``batch_size`` images made by ``batch``.
+        :parameter prefetch: ``int`` or ``None``.
+            Maximal number of images (or batches) being processed ahead of the consumer.
+            By default, ``2 * workers``.
+        '''
+        workers = workers or os.cpu_count() or 1
+        prefetch = max(prefetch or 2 * workers, 1)
+        if batch_size is None:
+            tasks = ((self.forward, image) for image in images)
+        else:
+            tasks = ((self.batch, chunk) for chunk in _chunks(images, batch_size))
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = collections.deque()
+            try:
+                for func, arg in tasks:
+                    futures.append(executor.submit(func, arg))
+                    if len(futures) >= prefetch:
+                        yield futures.popleft().result()
+                while futures:
+                    yield futures.popleft().result()
+            finally:
+                # Don't process images nobody will read
+                for future in futures:
+                    future.cancel()
+
+    def get_transform(self, image):
+        '''
+        Get the transform from relative coordinates on the preprocessed image
+        to relative coordinates on the original image.
+
+        It is needed to put detections back on the original image if ``padding`` is ``True``.
+        Otherwise, it is an identity transform.
+
+        Example::
+
+            image_prepared = preproc(image_rgb)
+            boxes = detector(image_prepared)
+            boxes = preproc.get_transform(image_rgb)(boxes)
+
+        :parameter image: np.ndarray or ``tuple``.
+            Original image or its shape.
+        :return: :class:`nnio.LetterboxTransform`
+        '''
+        shape = image.shape if isinstance(image, np.ndarray) else image
+        if self.resize is None or not self.padding:
+            return _output.LetterboxTransform()
+        width, height = self.resize
+        (new_width, new_height), (start_0, start_1) = _letterbox_geometry(tuple(shape[:2]), tuple(self.resize))
+        return _output.LetterboxTransform(
+            scale_x=width / new_width,
+            scale_y=height / new_height,
+            offset_x=-start_1 / new_width,
+            offset_y=-start_0 / new_height,
+        )
+
+    def _output_shape(self, image):
+        '''
+        :parameter image: np.ndarray. Input RGB image.
+        :return: ``tuple``. Shape of the preprocessed image without batch dimension.
+        '''
+        if self.resize is not None:
+            width, height = self.resize
+        else:
+            height, width = image.shape[:2]
+        if image.ndim != 3 and (self.channels_first or self.bgr or self.to_gray is not None):
+            raise BaseException('channels_first, bgr and to_gray require image of shape [H, W, C]. Got shape {}'.format(
+                image.shape))
+        if self.to_gray is None:
+            channels = image.shape[2:]
+        else:
+            channels = (self.to_gray,) if self.to_gray > 0 else ()
+        if self.channels_first:
+            return channels + (height, width)
+        return (height, width) + channels
+
+    def _check_out(self, out, shape):
+        '''
+        Allocate output array or check that the given one fits.
+        '''
+        if out is None:
+            return np.empty(shape, dtype=self.dtype)
+        if tuple(out.shape) != tuple(shape) or out.dtype != np.dtype(self.dtype):
+            raise BaseException('Expected out array of shape {} and dtype {}. Got shape {} and dtype {}'.format(
+                shape, self.dtype, out.shape, out.dtype))
+        return out
+
+    def _preprocess(self, image, out):
+        '''
+        Apply all preprocessing steps except adding batch dimension.
+
+        :parameter image: np.ndarray of type ``uint8``. RGB image.
+        :parameter out: np.ndarray. Array to write preprocessed image to.
+            Intermediate results are stored in the buffers reused between calls.
+        '''
         if str(image.dtype) != 'uint8':
             raise BaseException('Input image data type for preprocessor must be uint8')
+        if image.ndim != 3 or image.shape[2] != 3:
+            # Lookup table and color conversion are made for RGB images
+            self._preprocess_arithmetic(image, out)
+            return
+        plan = self._plan(image.shape[:2])
+
+        for i, step in enumerate(plan):
+            # The last step writes directly to the output if it can
+            last = i == len(plan) - 1 and not self.channels_first
+            if step == 'resize':
+                shape = (self.resize[1], self.resize[0]) + image.shape[2:]
+                dst = self._buffer('resize', shape, image.dtype, out if last else None)
+                image = self._resize_image(image, self.resize, self.padding, out=dst)
+            elif step == 'bgr':
+                dst = self._buffer('bgr', image.shape, image.dtype, out if last else None)
+                # pylint: disable=no-member
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=dst)
+            elif step == 'lut':
+                dst = self._buffer('lut', image.shape, self._lut.dtype, out if last else None)
+                image = self._apply_lut(image, dst)
+            elif step == 'gray':
+                dst = None
+                if last and out.size == image.shape[0] * image.shape[1]:
+                    dst = out.reshape(image.shape[:2])
+                dst = self._buffer('gray', image.shape[:2], image.dtype, dst)
+                image = self._apply_gray(image, dst)
+
+        if self.to_gray is not None:
+            # Expand channels of grayscale image as a view
+            if self.to_gray == 1:
+                image = image[:, :, None]
+            elif self.to_gray > 1:
+                image = np.broadcast_to(image[:, :, None], image.shape + (self.to_gray,))
 
+        # Change shape
+        if self.channels_first:
+            image = image.transpose([2, 0, 1])
+
+        # Change datatype while writing to the output
+        if not np.shares_memory(image, out):
+            np.copyto(out, image, casting='unsafe')
+
+    def _preprocess_arithmetic(self, image, out):
+        '''
+        Apply preprocessing steps one by one with numpy arithmetic.
+        Used for images which are not RGB, e.g. grayscale images of shape ``[H, W]`` or RGBA images.
+        '''
         # Convert colors
         if self.bgr:
             image = image[:, :, ::-1]
 
         # Resize image
         if self.resize is not None:
-            image = self._resize_image(image, self.resize, self.padding)
+            image = self._resize_image(np.ascontiguousarray(image), self.resize, self.padding)
 
         # Shift and scale
         if self._means is not None:
@@ -167,39 +479,183 @@ class Preprocessing(_model.Model):
         # Change shape
         if self.channels_first:
             image = image.transpose([2, 0, 1])
-        if self.batch_dimension:
-            image = image[None]
 
-        # Change datatype
-        image = image.astype(self.dtype)
+        # Change datatype while writing to the output
+        np.copyto(out, image, casting='unsafe')
 
-        if return_original:
-            return image.copy(), orig_image
+    def _plan(self, shape):
+        '''
+        Choose the order of preprocessing steps which does the least work.
+
+        All orders give the same result up to rounding.
+        Steps applied to every pixel (channel swap, normalization, grayscale conversion)
+        are done on the smaller of the original and the resized image.
+        Normalization is done after padding, since it changes the value of padded pixels.
+
+        :parameter shape: ``tuple``. (height, width) of the input image.
+        :return: list of step names: ``resize``, ``bgr``, ``lut``, ``gray``.
+        '''
+        pixel_steps = []
+        # Grayscale conversion doesn't depend on channel order. Normalization table accounts for it
+        if self.bgr and self.to_gray is None:
+            pixel_steps.append('bgr')
+        if self._lut is not None:
+            pixel_steps.append('lut')
+        if self.to_gray is not None:
+            pixel_steps.append('gray')
+        if self.resize is None:
+            return pixel_steps
+        upscale = shape[0] * shape[1] < self.resize[0] * self.resize[1]
+        if not upscale:
+            return ['resize'] + pixel_steps
+        if self._lut is None:
+            if self.to_gray is not None:
+                # Averaged uint8 values are rounded, so they must be averaged after resize
+                return ['resize'] + pixel_steps
         else:
-            return image.copy()
+            if self.padding:
+                return ['resize'] + pixel_steps
+            if self._lut.dtype not in _CV2_RESIZE_DTYPES:
+                return ['resize'] + pixel_steps
+        return pixel_steps + ['resize']
+
+    def _buffer(self, name, shape, dtype, out=None):
+        '''
+        Get an array for an intermediate result.
+
+        :parameter name: ``str``. Name of the preprocessing step.
+        :parameter out: ``None`` or np.ndarray.
+            If ``out`` fits, it will be returned instead of the buffer.
+        :return: np.ndarray. The same array is returned for the same name, shape and dtype.
+            Buffers are local to the calling thread.
+        '''
+        dtype = np.dtype(dtype)
+        if (
+            out is not None
+            and out.shape == tuple(shape)
+            and out.dtype == dtype
+            and out.flags.c_contiguous
+        ):
+            return out
+        buffer = getattr(self._buffers, name, None)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            setattr(self._buffers, name, buffer)
+        return buffer
+
+    def _make_lut(self):
+        '''
+        Precompute normalization for every possible uint8 value.
+
+        :return: ``None`` if there is no normalization,
+            else np.ndarray of shape ``[256, 1, 3]``.
+        '''
+        lut_dtype = np.dtype(self.dtype)
+        if self.to_gray is not None:
+            # Grayscale conversion must average values before they are rounded to an integer type
+            if lut_dtype not in (np.dtype('float32'), np.dtype('float64')):
+                if self._means is None and self._scales is None and not np.issubdtype(lut_dtype, np.floating):
+                    # Average uint8 values directly
+                    return None
+                lut_dtype = np.dtype('float32')
+        elif self._means is None and self._scales is None:
+            return None
+        lut = np.arange(256, dtype=np.float64)[:, None].repeat(3, axis=1)
+        if self._means is not None:
+            lut = lut - np.reshape(self._means, -1)
+        if self._scales is not None:
+            lut = lut * np.reshape(self._scales, -1)
+        if self.to_gray is not None and self.bgr:
+            # Channels are not swapped for grayscale images. Swap them in the table instead
+            lut = lut[:, ::-1]
+        return np.ascontiguousarray(lut.astype(lut_dtype).reshape(256, 1, 3))
+
+    def _apply_lut(self, image, out):
+        '''
+        Normalize uint8 image in a single pass without float64 intermediates.
+        '''
+        if self._lut.dtype in _CV2_LUT_DTYPES:
+            # pylint: disable=no-member
+            return cv2.LUT(image, self._lut, dst=out)
+        out[...] = self._lut[image, 0, np.arange(3)]
+        return out
 
     @staticmethod
-    def _read_image(path):
-        ''' Read image from file or url '''
-        # Download image if path is url
-        is_url = _utils.is_url(path)
-        if is_url:
-            path = _utils.file_from_url(path, 'temp', use_cached=False)
+    def _apply_gray(image, out):
+        '''
+        Average channels of the image.
+
+        :parameter image: np.ndarray of shape ``[H, W, 3]``.
+            Type ``uint8``, ``float32`` or ``float64``.
+        :parameter out: np.ndarray of shape ``[H, W]``.
+        '''
+        weights = _GRAY_WEIGHTS_UINT8 if image.dtype == np.uint8 else _GRAY_WEIGHTS
+        # pylint: disable=no-member
+        return cv2.transform(image, weights, dst=out)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Buffers are thread-local and can't be pickled
+        del state['_buffers']
+        state.pop('_executor', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffers = threading.local()
+
+    @staticmethod
+    def _read_image(path, resize=None, padding=False):
+        ''' Read image from file, url or bytes
+
+        If ``resize`` is given, jpeg images are decoded at reduced resolution (1/2, 1/4 or 1/8)
+        as long as it is not smaller than the size they will be resized to.
+        '''
+        # Get encoded image
+        if isinstance(path, (bytes, bytearray, memoryview)):
+            data = path
+            path = '<bytes>'
+        elif _utils.is_url(path):
+            # Download image into memory
+            data = _utils.read_url(path)
+        else:
+            data = None
+
+        # Choose resolution of the decoded image
+        factor = 1
+        if resize is not None:
+            if data is None:
+                try:
+                    with open(path, 'rb') as f:
+                        size = _jpeg_size(f)
+                except OSError:
+                    size = None
+            else:
+                size = _jpeg_size(io.BytesIO(data))
+            if size is not None:
+                factor = _reduction_factor(size, resize, padding)
+
         # Read image
         # pylint: disable=no-member
-        image = cv2.imread(path)
-        # Delete temporary file
-        if is_url:
-            os.remove(path)
+        def decode(factor):
+            if data is None:
+                return cv2.imread(path, _REDUCED_COLOR_FLAGS[factor])
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), _REDUCED_COLOR_FLAGS[factor])
+        image = decode(factor)
+        # Image may turn out smaller than expected if it is rotated according to EXIF
+        if image is not None and factor > 1:
+            if _reduction_factor(image.shape[1::-1], resize, padding) < 1:
+                image = decode(1)
+
         # Throw exception
         if image is None:
             raise BaseException('Cannot read ' + path)
-        # Convert from BGR to RGB
-        image = image[:, :, ::-1]
+        # Convert from BGR to RGB in place
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
         return image
 
     @staticmethod
-    def _resize_image(image, resize, padding=False):
+    def _resize_image(image, resize, padding=False, out=None):
         ''' Resize image
         
         :parameter image: np.ndarray of type ``uint8`` or ``str``
@@ -209,32 +665,35 @@ class Preprocessing(_model.Model):
             (width, height) - the new size of image
         :parameter padding: ``bool``.
             If ``True``, images will be resized with the same aspect ratio
+        :parameter out: ``None`` or np.ndarray.
+            Array to write resized image to.
         :return: np.array. Resized image.
         '''
         if not padding:
             # pylint: disable=no-member
-            image = cv2.resize(image, resize)
+            image = cv2.resize(image, resize, dst=out)
         else:
             # Resize saving the aspect ratio
-            ratio_0 = image.shape[1] / resize[0]
-            ratio_1 = image.shape[0] / resize[1]
-            ratio = max(ratio_0, ratio_1)
-            new_size = (
-                int(image.shape[1] / ratio),
-                int(image.shape[0] / ratio)
-            )
+            (new_width, new_height), (start_0, start_1) = _letterbox_geometry(image.shape[:2], tuple(resize))
+            if out is None:
+                out = np.zeros([resize[1], resize[0]] + list(image.shape[2:]), dtype=image.dtype)
+            else:
+                # Pad with zeros. Only the borders are filled, the rest is overwritten by the resized image
+                out[:start_0] = 0
+                out[start_0 + new_height:] = 0
+                out[start_0: start_0 + new_height, :start_1] = 0
+                out[start_0: start_0 + new_height, start_1 + new_width:] = 0
+            # Write resized image directly into the padded array
             # pylint: disable=no-member
-            image = cv2.resize(image, new_size)
-            # Pad with zeros
-            padding = np.zeros([resize[1], resize[0], 3],
-                               dtype=image.dtype)
-            start_0 = (padding.shape[0] - image.shape[0]) // 2
-            start_1 = (padding.shape[1] - image.shape[1]) // 2
-            padding[
-                start_0: start_0 + image.shape[0],
-                start_1: start_1 + image.shape[1],
-            ] = image
-            image = padding.copy()
+            cv2.resize(
+                image,
+                (new_width, new_height),
+                dst=out[
+                    start_0: start_0 + new_height,
+                    start_1: start_1 + new_width,
+                ]
+            )
+            image = out
         return image
 
     def __str__(self):
@@ -260,3 +719,94 @@ class Preprocessing(_model.Model):
     def __eq__(self, other):
         '''Compare two ``Preprocessing`` objects. Returns ``True`` only if all preprocessing parameters are the same.'''
         return str(self) == str(other)
+
+
+@functools.lru_cache(maxsize=256)
+def _letterbox_geometry(shape, resize):
+    '''
+    Compute where the image is placed when resized with padding.
+
+    :parameter shape: ``tuple``. (height, width) of the original image.
+    :parameter resize: ``tuple``. (width, height) of the padded image.
+    :return: ``((new_width, new_height), (start_0, start_1))`` -
+        size of the resized image and the position of its top-left corner.
+    '''
+    ratio_0 = shape[1] / resize[0]
+    ratio_1 = shape[0] / resize[1]
+    ratio = max(ratio_0, ratio_1)
+    new_size = (
+        int(shape[1] / ratio),
+        int(shape[0] / ratio)
+    )
+    start_0 = (resize[1] - new_size[1]) // 2
+    start_1 = (resize[0] - new_size[0]) // 2
+    return new_size, (start_0, start_1)
+
+
+def _reduction_factor(size, resize, padding):
+    '''
+    Choose how much the image can be downscaled before it is resized.
+
+    :parameter size: ``tuple``. (width, height) of the image.
+    :parameter resize: ``tuple``. (width, height) of the resized image.
+    :parameter padding: ``bool``. Whether aspect ratio is preserved on resize.
+    :return: ``int``. 8, 4, 2 or 1 if image can be downscaled by this factor.
+        0 if image is already smaller than it is needed.
+    '''
+    ratio_0 = size[0] / resize[0]
+    ratio_1 = size[1] / resize[1]
+    # With padding, the image is resized by the larger ratio
+    ratio = max(ratio_0, ratio_1) if padding else min(ratio_0, ratio_1)
+    for factor in [8, 4, 2, 1]:
+        if ratio >= factor:
+            return factor
+    return 0
+
+
+def _jpeg_size(f):
+    '''
+    Read size of a jpeg image from its header without decoding it.
+
+    :parameter f: binary file object positioned at the beginning of the file.
+    :return: ``tuple`` (width, height) or ``None`` if it is not a jpeg file.
+    '''
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        # Find next marker
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        # Markers without payload
+        if marker == 0x01 or 0xd0 <= marker <= 0xd9:
+            continue
+        length = f.read(2)
+        if len(length) < 2:
+            return None
+        length = int.from_bytes(length, 'big')
+        # Start of frame markers contain the image size
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            header = f.read(5)
+            if len(header) < 5:
+                return None
+            height = int.from_bytes(header[1:3], 'big')
+            width = int.from_bytes(header[3:5], 'big')
+            return width, height
+        f.seek(length - 2, io.SEEK_CUR)
+
+
+def _chunks(iterable, size):
+    '''
+    Split iterable into lists of ``size`` elements. The last list may be shorter.
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
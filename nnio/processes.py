@@ -0,0 +1,319 @@
+import multiprocessing
+import multiprocessing.reduction
+import multiprocessing.shared_memory
+import queue
+import weakref
+import numpy as np
+
+from . import model as _model
+
+# Arrays in shared memory start at multiples of this number of bytes
+_ALIGNMENT = 64
+
+
+class ProcessPoolModel(_model.Model):
+    '''
+    Runs copies of a model in several worker processes.
+
+    Each worker process creates its own model with ``factory``,
+    so pre- and postprocessing of the model do not compete for one GIL.
+    Numpy arrays are passed to the workers and back through shared memory instead of being pickled.
+    Other values (e.g. :class:`nnio.DetectionBox` objects returned by zoo models) are pickled.
+
+    Usage example::
+
+        def make_model():
+            return nnio.zoo.onnx.detection.SSDMobileNetV1()
+
+        model = nnio.ProcessPoolModel(make_model, workers=4)
+
+        # Call from many threads
+        boxes = model(image)
+
+    ``factory`` is sent to the worker processes, so it must be picklable:
+    a function defined at the module level, a class or ``functools.partial`` of them.
+    '''
+    def __init__(
+        self,
+        factory,
+        workers=None,
+        slab_size=8 * 2**20,
+        start_method='spawn',
+    ):
+        '''
+        :parameter factory: function without arguments which returns :class:`nnio.Model`.
+        :parameter workers: ``int``. Number of worker processes. By default, number of CPUs.
+        :parameter slab_size: ``int``. Initial size in bytes of the shared memory for inputs and for outputs
+            of each worker. It grows if the data does not fit.
+        :parameter start_method: ``'spawn'``, ``'forkserver'`` or ``'fork'``.
+            ``'fork'`` starts faster but is unsafe if some backend has already started threads.
+        '''
+        super().__init__()
+        self.workers = workers or multiprocessing.cpu_count()
+        context = multiprocessing.get_context(start_method)
+
+        self._workers = []
+        self._idle_workers = queue.Queue()
+        self._closed = False
+        self._finalizer = weakref.finalize(self, _close_workers, self._workers)
+        try:
+            for _ in range(self.workers):
+                self._workers.append(_Worker(context, factory, slab_size))
+            # Wait until all models are loaded
+            for worker in self._workers:
+                worker.wait_ready()
+                self._idle_workers.put(worker)
+        except BaseException:
+            self._finalizer()
+            raise
+
+    def forward(self, *args, **kwargs):
+        r'''
+        Call ``forward`` of the model in an idle worker process. Waits if all workers are busy.
+
+        :parameter \*args: arguments of ``forward`` of the model.
+        :parameter \*\*kwargs: keyword arguments of ``forward`` of the model.
+        :return: result of ``forward`` of the model.
+        '''
+        return self._call('forward', args, kwargs)
+
+    def submit(self, *args, **kwargs):
+        r'''
+        Call the model without waiting for the result.
+        Up to ``workers`` calls are processed at the same time.
+
+        :return: ``concurrent.futures.Future`` with the result of ``forward``.
+        '''
+        return self._get_executor(self.workers).submit(self.forward, *args, **kwargs)
+
+    def close(self):
+        '''
+        Stop the worker processes and free shared memory.
+        '''
+        self._closed = True
+        executor = self.__dict__.get('_executor')
+        if executor is not None:
+            executor.shutdown()
+        self._finalizer()
+
+    def get_preprocessing(self):
+        return self._call('get_preprocessing', (), {})
+
+    def get_input_details(self):
+        return self._call('get_input_details', (), {})
+
+    def get_output_details(self):
+        return self._call('get_output_details', (), {})
+
+    def __str__(self):
+        return 'ProcessPoolModel(workers={})'.format(self.workers)
+
+    def _call(self, method, args, kwargs):
+        if self._closed:
+            raise BaseException('ProcessPoolModel is closed')
+        worker = self._idle_workers.get()
+        try:
+            return worker.call(method, args, kwargs)
+        finally:
+            self._idle_workers.put(worker)
+
+
+class _Worker:
+    '''
+    Worker process with its shared memory slabs. Used by one thread at a time.
+    '''
+    def __init__(self, context, factory, slab_size):
+        self.input_slab = multiprocessing.shared_memory.SharedMemory(create=True, size=slab_size)
+        self.output_slab = multiprocessing.shared_memory.SharedMemory(create=True, size=slab_size)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(factory, child_conn, self.input_slab.name, self.output_slab.name),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self):
+        status, value = self.conn.recv()
+        if status == 'error':
+            raise value
+
+    def call(self, method, args, kwargs):
+        # Put inputs into shared memory
+        data = (args, kwargs)
+        size = _nbytes(data)
+        if size > self.input_slab.size:
+            self._resize('input', size)
+        struct = _encode(data, self.input_slab.buf, [0])
+        self.conn.send(('call', method, struct))
+        while True:
+            status, value = self.conn.recv()
+            if status == 'ok':
+                # Copy outputs, since the slab is reused by the next call
+                return _decode(value, self.output_slab.buf, copy=True)
+            if status == 'grow':
+                self._resize('output', value)
+                self.conn.send(('slabs', self.input_slab.name, self.output_slab.name))
+            else:
+                raise value
+
+    def close(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        for slab in [self.input_slab, self.output_slab]:
+            slab.close()
+            slab.unlink()
+
+    def _resize(self, kind, size):
+        ''' Replace input or output slab with a bigger one '''
+        name = kind + '_slab'
+        old = getattr(self, name)
+        # Grow at least twice to avoid resizing on every call
+        new = multiprocessing.shared_memory.SharedMemory(create=True, size=max(size, 2 * old.size))
+        setattr(self, name, new)
+        if kind == 'input':
+            self.conn.send(('slabs', self.input_slab.name, self.output_slab.name))
+        old.close()
+        old.unlink()
+
+
+def _close_workers(workers):
+    for worker in workers:
+        worker.close()
+
+
+def _attach(name):
+    '''
+    Open shared memory created by the parent process.
+    Worker processes share the resource tracker of the parent, which unlinks the memory.
+    '''
+    return multiprocessing.shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(factory, conn, input_name, output_name):
+    '''
+    Main function of a worker process
+    '''
+    try:
+        model = factory()
+    except BaseException as e: # pylint: disable=broad-except
+        conn.send(('error', _picklable(e)))
+        return
+    input_slab = _attach(input_name)
+    output_slab = _attach(output_name)
+    conn.send(('ready', None))
+
+    result = None
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        if message[0] == 'slabs':
+            _, input_name, output_name = message
+            if input_name != input_slab.name:
+                input_slab.close()
+                input_slab = _attach(input_name)
+            if output_name != output_slab.name:
+                output_slab.close()
+                output_slab = _attach(output_name)
+            if result is None:
+                continue
+        else:
+            _, method, struct = message
+            try:
+                args, kwargs = _decode(struct, input_slab.buf)
+                result = (getattr(model, method)(*args, **kwargs),)
+                del args, kwargs
+            except BaseException as e: # pylint: disable=broad-except
+                result = None
+                conn.send(('error', _picklable(e)))
+                continue
+
+        # Send the result through the output slab
+        size = _nbytes(result[0])
+        if size > output_slab.size:
+            conn.send(('grow', size))
+            continue
+        try:
+            struct = _encode(result[0], output_slab.buf, [0])
+            conn.send(('ok', struct))
+        except BaseException as e: # pylint: disable=broad-except
+            conn.send(('error', _picklable(e)))
+        result = None
+
+    input_slab.close()
+    output_slab.close()
+
+
+def _picklable(e):
+    ''' Exception which can be sent to the parent process '''
+    try:
+        multiprocessing.reduction.ForkingPickler.dumps(e)
+        return e
+    except Exception: # pylint: disable=broad-except
+        return BaseException(repr(e))
+
+
+def _is_shared(x):
+    ''' Arrays which are passed through shared memory '''
+    return isinstance(x, np.ndarray) and not x.dtype.hasobject
+
+
+def _nbytes(obj):
+    ''' Size of shared memory needed for all arrays in obj '''
+    if _is_shared(obj):
+        return -(-obj.nbytes // _ALIGNMENT) * _ALIGNMENT
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(x) for x in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(x) for x in obj.values())
+    return 0
+
+
+def _encode(obj, buf, offset):
+    '''
+    Write arrays from obj into buf and return description of obj with other values as is.
+
+    :parameter offset: list with one element: current offset in buf.
+    '''
+    if _is_shared(obj):
+        start = offset[0]
+        view = np.ndarray(obj.shape, dtype=obj.dtype, buffer=buf, offset=start)
+        view[...] = obj
+        del view
+        offset[0] += _nbytes(obj)
+        return ('array', start, obj.shape, obj.dtype.str)
+    if isinstance(obj, list):
+        return ('list', [_encode(x, buf, offset) for x in obj])
+    if type(obj) is tuple: # pylint: disable=unidiomatic-typecheck
+        return ('tuple', [_encode(x, buf, offset) for x in obj])
+    if type(obj) is dict: # pylint: disable=unidiomatic-typecheck
+        return ('dict', [(key, _encode(x, buf, offset)) for key, x in obj.items()])
+    return ('object', obj)
+
+
+def _decode(struct, buf, copy=False):
+    '''
+    Restore object from its description made by _encode.
+
+    :parameter copy: if ``False``, arrays are views of buf.
+    '''
+    kind = struct[0]
+    if kind == 'array':
+        _, start, shape, dtype = struct
+        view = np.ndarray(shape, dtype=dtype, buffer=buf, offset=start)
+        return view.copy() if copy else view
+    if kind == 'list':
+        return [_decode(x, buf, copy) for x in struct[1]]
+    if kind == 'tuple':
+        return tuple(_decode(x, buf, copy) for x in struct[1])
+    if kind == 'dict':
+        return {key: _decode(x, buf, copy) for key, x in struct[1]}
+    return struct[1]
@@ -1,4 +1,6 @@
+import os
 import time
+import numpy as np
 
 from . import model as _model
 from . import utils as _utils
@@ -35,14 +37,42 @@ class TorchModel(_model.Model):
         self,
         model_path: str,
         device: str='cpu',
+        num_threads=None,
+        num_interop_threads=None,
+        freeze=False,
+        memory_format=None,
+        precision='fp32',
     ):
         '''
 
         :parameter model_path: URL or path to the torchscript model
         :parameter device: Can be either ``cpu`` or ``cuda``.
+        :parameter num_threads: ``int`` or ``None``. Number of threads used by torch for intra-op parallelism.
+            This setting is global for the process.
+        :parameter num_interop_threads: ``int`` or ``None``. Number of threads used by torch for inter-op parallelism.
+            This setting is global for the process and can be set only before torch runs anything in parallel.
+        :parameter freeze: ``bool``.
+            If ``True``, the torchscript model is frozen with ``torch.jit.freeze``
+            and optimized with ``torch.jit.optimize_for_inference``.
+            The frozen model is saved to the cache directory and loaded the next time.
+            The cache is keyed by the model file, the device, the memory format and the torch version.
+        :parameter memory_format: ``None`` or ``'channels_last'``.
+            If ``'channels_last'``, weights and 4-dimensional inputs are converted to the NHWC memory layout,
+            which is faster for convolutional models on modern CPUs.
+            Inputs which are already in this layout (e.g. ``image_nhwc.transpose(0, 3, 1, 2)``) are not copied.
+        :parameter precision: ``'fp32'`` or ``'bf16'``.
+            If ``'bf16'``, the model runs under CPU autocast to bfloat16. Outputs are converted back to float32.
+            With ``freeze=True``, ``optimize_for_inference`` is skipped, since the optimized graph ignores autocast.
+            Use ``check_accuracy`` to see how much the results change.
         '''
+        if memory_format not in [None, 'channels_last']:
+            raise BaseException('memory_format must be None or "channels_last", got {}'.format(memory_format))
+        if precision not in ['fp32', 'bf16']:
+            raise BaseException('precision must be "fp32" or "bf16", got {}'.format(precision))
         super().__init__()
         self.device = device
+        self.memory_format = memory_format
+        self.precision = precision
 
         # Download file from the internet
         if _utils.is_url(model_path):
@@ -50,25 +80,29 @@ class TorchModel(_model.Model):
 
         import torch
         self.torch = torch
-        try:
-            self.model = torch.jit.load(model_path)
-        except:
-            self.model = torch.load(model_path)
-        self.model.to(device)
-        self.model.eval()
-
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        if num_interop_threads is not None and torch.get_num_interop_threads() != num_interop_threads:
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as e:
+                print('Warning: cannot set number of interop threads:', e)
+        self.model_path = model_path
+        self.model = self._load_model(model_path, device, freeze, memory_format, precision)
+        # Model in the default memory format, used by check_accuracy
+        self._reference_model = None
 
     def forward(self, *inputs, return_info=False):
-        # Convert inputs to torch tensors
-        # pylint: disable=no-member
-        inp_torch = [self.torch.tensor(inp, device=self.device) for inp in inputs]
-
-        # Run network and measure time
+        r'''
+        :parameter \*inputs: numpy arrays, inputs to the model.
+            On ``cpu``, tensors share memory with the arrays.
+        :parameter return_info: bool, If True, will return inference time
+        :return: numpy array for a single tensor output.
+            List of numpy arrays for tuple or list outputs, dictionary of numpy arrays for dict outputs.
+        '''
         start = time.time()
-        with self.torch.no_grad():
-            outp_torch = self.model(*inp_torch)
+        results = self._run(self.model, inputs, self.memory_format, self.precision)
         end = time.time()
-        results = outp_torch.cpu().numpy()
 
         # Return results
         if return_info:
@@ -78,3 +112,119 @@ class TorchModel(_model.Model):
             return results, info
         else:
             return results
+
+    @property
+    def thread_safe(self):
+        ''' Torch modules can be called from several threads in inference mode '''
+        return True
+
+    def check_accuracy(self, *inputs):
+        r'''
+        Compare results of the model in the chosen ``memory_format`` and ``precision``
+        with results of the original model in the default memory format and float32.
+
+        Example::
+
+            model = nnio.TorchModel('path/to/model.pt', memory_format='channels_last', precision='bf16')
+            print(model.check_accuracy(image))
+            print(nnio.utils.benchmark(model, image))
+
+        :parameter \*inputs: numpy arrays, sample inputs to the model.
+        :return: dictionary with ``max_abs_diff``, ``mean_abs_diff`` and ``max_rel_diff``
+            over all outputs of the model.
+            ``max_rel_diff`` is ``max_abs_diff`` divided by the largest absolute value of the reference outputs.
+        '''
+        if self._reference_model is None:
+            self._reference_model = self._load_model(self.model_path, self.device, False)
+        results = _flatten(self._run(self.model, inputs, self.memory_format, self.precision))
+        reference = _flatten(self._run(self._reference_model, inputs, None, 'fp32'))
+        abs_diff = np.concatenate([
+            np.abs(res.astype(np.float64) - ref.astype(np.float64)).ravel()
+            for res, ref in zip(results, reference)
+        ])
+        ref_abs = np.concatenate([np.abs(ref.astype(np.float64)).ravel() for ref in reference])
+        return {
+            'max_abs_diff': float(abs_diff.max()),
+            'mean_abs_diff': float(abs_diff.mean()),
+            'max_rel_diff': float(abs_diff.max() / max(ref_abs.max(), 1e-12)),
+        }
+
+    def _run(self, model, inputs, memory_format, precision):
+        ''' Run model on numpy inputs and return numpy outputs '''
+        # Convert inputs to torch tensors
+        inp_torch = [self._to_torch(inp, memory_format) for inp in inputs]
+        with self.torch.inference_mode():
+            # pylint: disable=no-member
+            with self.torch.autocast(
+                    self.torch.device(self.device).type,
+                    dtype=self.torch.bfloat16,
+                    enabled=precision == 'bf16'):
+                outp_torch = model(*inp_torch)
+        return self._to_numpy(outp_torch)
+
+    def _to_torch(self, inp, memory_format=None):
+        ''' Convert numpy array to torch tensor without copying where possible '''
+        inp = np.asarray(inp)
+        # Torch does not support negative strides and read-only memory
+        if not inp.flags.writeable or any(stride < 0 for stride in inp.strides):
+            inp = inp.copy()
+        # pylint: disable=no-member
+        tensor = self.torch.from_numpy(inp).to(self.device)
+        if memory_format == 'channels_last' and tensor.dim() == 4:
+            tensor = tensor.contiguous(memory_format=self.torch.channels_last)
+        return tensor
+
+    def _to_numpy(self, out):
+        ''' Convert torch outputs to numpy '''
+        if isinstance(out, (tuple, list)):
+            return [self._to_numpy(x) for x in out]
+        if isinstance(out, dict):
+            return {key: self._to_numpy(x) for key, x in out.items()}
+        # Numpy does not support bfloat16
+        if out.dtype == self.torch.bfloat16: # pylint: disable=no-member
+            out = out.float()
+        return out.cpu().numpy()
+
+    def _load_model(self, model_path, device, freeze, memory_format=None, precision='fp32'):
+        ''' Load model and move it to the device '''
+        torch = self.torch
+        if freeze:
+            key = _utils.content_hash(model_path, device, memory_format, torch.__version__)
+            cached_path = os.path.join(_utils.cache_dir('torch_frozen'), key + '.pt')
+            if os.path.exists(cached_path):
+                model = torch.jit.load(cached_path, map_location=device)
+                return self._optimize(model, precision)
+        try:
+            model = torch.jit.load(model_path, map_location=device)
+        except:
+            model = torch.load(model_path)
+        model.to(device)
+        if memory_format == 'channels_last':
+            model.to(memory_format=torch.channels_last) # pylint: disable=no-member
+        model.eval()
+        if not freeze:
+            return model
+
+        if not isinstance(model, torch.jit.ScriptModule):
+            raise BaseException('Only torchscript models can be frozen')
+        model = torch.jit.freeze(model)
+        _utils.atomic_save(cached_path, lambda temp_path: torch.jit.save(model, temp_path))
+        return self._optimize(model, precision)
+
+    def _optimize(self, frozen_model, precision):
+        '''
+        Optimized graph may contain nodes which cannot be saved, so frozen models are optimized after loading.
+        Optimized graph ignores autocast, so models in bf16 are not optimized.
+        '''
+        if precision == 'bf16':
+            return frozen_model
+        return self.torch.jit.optimize_for_inference(frozen_model)
+
+
+def _flatten(results):
+    ''' List of numpy arrays from results of TorchModel '''
+    if isinstance(results, list):
+        return [x for res in results for x in _flatten(res)]
+    if isinstance(results, dict):
+        return [x for res in results.values() for x in _flatten(res)]
+    return [results]
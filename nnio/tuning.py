@@ -0,0 +1,168 @@
+import gc
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from . import utils as _utils
+
+# Statistic of utils.benchmark minimized for each objective
+_OBJECTIVES = {
+    'p50': 'median',
+    'p99': 'p99',
+    'throughput': 'mean',
+}
+
+# Lock for reading and writing the decision cache
+_cache_lock = threading.Lock()
+
+
+def autotune(
+    candidates,
+    sample_input,
+    objective='p50',
+    memory_budget=None,
+    warmup=10,
+    iters=50,
+    use_cache=True,
+    cache_key=None,
+    return_report=False,
+):
+    '''
+    Choose the fastest of several models on this machine.
+
+    Each candidate model is created, called ``warmup`` times and then timed for ``iters`` calls
+    with :func:`nnio.utils.benchmark`.
+    The decision is saved to the cache directory for this host,
+    and the next time only the chosen model is created.
+
+    Example::
+
+        model = nnio.autotune(
+            {
+                'onnx': lambda: nnio.zoo.onnx.detection.SSDMobileNetV1(),
+                'openvino': lambda: nnio.zoo.openvino.detection.SSDMobileNetV2(),
+                'tflite_4_threads': lambda: nnio.zoo.edgetpu.detection.SSDMobileNet(num_threads=4),
+            },
+            sample_input=image,
+            objective='p99',
+            memory_budget=500 * 2**20,
+        )
+
+    :parameter candidates: dictionary ``{name: factory}``,
+        where ``factory`` is a function without arguments which returns a model.
+    :parameter sample_input: input to the models, or tuple of inputs.
+    :parameter objective: ``'p50'`` (median latency), ``'p99'`` (99th percentile of latency)
+        or ``'throughput'`` (calls per second).
+    :parameter memory_budget: ``int`` or ``None``. Maximal increase of the resident memory of the process
+        (in bytes) after creating and running a model. Models which use more are rejected.
+        Measured on Linux only. Memory of shared libraries is counted only for the first model which loads them.
+    :parameter warmup: ``int``. Number of calls before measuring.
+    :parameter iters: ``int``. Number of measured calls.
+    :parameter use_cache: ``bool``. If ``True``, the decision is read from and saved to the cache.
+        The decision is found by the names of the candidates, the shapes and types of ``sample_input``,
+        ``objective`` and ``memory_budget``. Factories are not compared,
+        so after changing what a factory creates under the same name, change ``cache_key``.
+    :parameter cache_key: any value with a stable ``repr``, e.g. a version string.
+        Decisions made with another ``cache_key`` are not used.
+    :parameter return_report: ``bool``. If ``True``, also returns a dictionary with the name of the chosen model
+        and measurements of all candidates.
+    :return: the chosen model.
+    '''
+    if objective not in _OBJECTIVES:
+        raise BaseException('objective must be one of {}, got {}'.format(list(_OBJECTIVES), objective))
+    if not isinstance(sample_input, tuple):
+        sample_input = (sample_input,)
+
+    # Look for the decision in cache
+    key = _utils.content_hash(
+        sorted(candidates),
+        [(np.shape(x), str(np.asarray(x).dtype)) for x in sample_input],
+        objective,
+        memory_budget,
+        cache_key,
+    )
+    cache_path = os.path.join(_utils.cache_dir('autotune'), 'decisions.json')
+    if use_cache:
+        report = _read_cache(cache_path).get(_utils.host_id(), {}).get(key)
+        if report is not None and report['best'] in candidates:
+            try:
+                model = candidates[report['best']]()
+            except Exception: # pylint: disable=broad-except
+                # E.g. the device has been removed. Measure the candidates again
+                model = None
+            if model is not None:
+                return (model, report) if return_report else model
+
+    # Measure all candidates
+    results = {}
+    best_name = None
+    best_model = None
+    for name, factory in candidates.items():
+        gc.collect()
+        memory_before = _resident_memory()
+        try:
+            start = time.time()
+            model = factory()
+            load_time = time.time() - start
+            stats = _utils.benchmark(model, *sample_input, warmup=warmup, iters=iters)
+        except Exception as e: # pylint: disable=broad-except
+            results[name] = {'error': repr(e)}
+            continue
+        stats['load_time'] = load_time
+        if memory_before is not None:
+            stats['memory'] = _resident_memory() - memory_before
+        results[name] = stats
+
+        # Compare with the best model
+        if memory_budget is not None and stats.get('memory', 0) > memory_budget:
+            stats['error'] = 'memory budget exceeded'
+        elif best_name is None or stats[_OBJECTIVES[objective]] < results[best_name][_OBJECTIVES[objective]]:
+            best_name = name
+            best_model = model
+        del model
+
+    if best_name is None:
+        raise BaseException('All candidates failed: {}'.format(results))
+    report = {
+        'best': best_name,
+        'objective': objective,
+        'results': results,
+    }
+
+    # Save the decision
+    if use_cache:
+        with _cache_lock:
+            decisions = _read_cache(cache_path)
+            decisions.setdefault(_utils.host_id(), {})[key] = report
+            _utils.atomic_save(cache_path, lambda temp_path: _write_json(decisions, temp_path))
+
+    return (best_model, report) if return_report else best_model
+
+
+def _read_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _write_json(decisions, path):
+    with open(path, 'w') as f:
+        json.dump(decisions, f, indent=2)
+
+
+def _resident_memory():
+    '''
+    :return: resident memory of the process in bytes, or ``None`` if it can not be measured.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
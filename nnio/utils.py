@@ -1,10 +1,17 @@
 import urllib.request
+import atexit
+import collections
 import os
 import pathlib
+import platform
 import getpass
 import datetime
+import hashlib
+import threading
+import time
 import numpy as np
 import requests
+import requests.adapters
 
 from . import __version__
 
@@ -13,9 +20,14 @@ PACKAGE_NAME = 'nnio'
 # Temperature logging flag
 LOG_TEMPERATURE = False
 temperature_files = {}
+_telemetry_lock = threading.Lock()
 
 URL_MARKERS = ['http://', 'https://', 'gdrive://']
 
+# HTTP session shared by all downloads into memory. It keeps connections alive
+_session = None
+_session_lock = threading.Lock()
+
 def is_url(s):
     '''
     Check if input string is url or not
@@ -50,18 +62,7 @@ def file_from_url(url, category='other', file_name=None, use_cached=True):
         url = f'https://docs.google.com/uc?id={gdrive_id}'
 
     # Get base path for file
-    base_path = os.path.join(
-        '/home',
-        getpass.getuser(),
-        '.cache',
-        PACKAGE_NAME,
-        '.'.join(__version__.split('.')[:2]),
-        category,
-        url_path,
-    )
-    # Create path if it does not exist
-    if not os.path.exists(base_path):
-        pathlib.Path(base_path).mkdir(parents=True, exist_ok=True)
+    base_path = cache_dir(category, url_path)
     # Get file path
     file_path = os.path.join(
         base_path,
@@ -78,6 +79,114 @@ def file_from_url(url, category='other', file_name=None, use_cached=True):
     return file_path
 
 
+def read_url(url, timeout=None):
+    '''
+    Downloads file into memory without writing it to disk.
+    Connections are pooled and kept alive between calls.
+    Returns file contents as bytes
+    '''
+    session = _get_session()
+    # Modify link for gdrive
+    if url.startswith('gdrive://'):
+        gdrive_id = url.replace('gdrive://', '').split('/')[0]
+        url = f'https://docs.google.com/uc?id={gdrive_id}'
+    response = session.get(url, timeout=timeout)
+    token = get_confirm_token(response)
+    if token:
+        params = {'confirm': token}
+        response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def cache_dir(category, *subdirs):
+    '''
+    Returns path to "/home/$USER/.cache/nnio/<version>/<category>/".
+    Creates this directory if it does not exist.
+    '''
+    base_path = os.path.join(
+        '/home',
+        getpass.getuser(),
+        '.cache',
+        PACKAGE_NAME,
+        '.'.join(__version__.split('.')[:2]),
+        category,
+        *subdirs
+    )
+    # Create path if it does not exist
+    if not os.path.exists(base_path):
+        pathlib.Path(base_path).mkdir(parents=True, exist_ok=True)
+    return base_path
+
+
+def content_hash(*items):
+    '''
+    Returns sha256 hex digest of files and values.
+    Strings which are paths to existing files are hashed by file contents,
+    bytes are hashed as is, other values are hashed by their repr.
+    '''
+    digest = hashlib.sha256()
+    for item in items:
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            digest.update(item)
+        elif isinstance(item, str) and os.path.isfile(item):
+            with open(item, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        else:
+            digest.update(repr(item).encode())
+        # Separate items
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def atomic_save(path, write_fn):
+    '''
+    Save a file so that other threads and processes never see it partially written.
+
+    ``write_fn(temp_path)`` writes the file to a temporary path,
+    which is then renamed to ``path``. Renaming is atomic.
+    If ``write_fn`` raises an exception, the temporary file is removed.
+    Returns the value returned by ``write_fn``.
+    '''
+    temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    try:
+        result = write_fn(temp_path)
+        if os.path.exists(temp_path):
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return result
+
+
+def host_id():
+    '''
+    Returns string with the host name and CPU model.
+    Used to keep cached results which are valid only on the same hardware.
+    '''
+    cpu = platform.processor()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    cpu = line.split(':', 1)[1].strip()
+                    break
+    return '{} ({}, {} x {})'.format(platform.node(), platform.machine(), os.cpu_count(), cpu)
+
+
 def download_file(url, file_path):
     if 'docs.google.com' in url:
         download_file_from_google_drive(url, file_path)
@@ -113,42 +222,211 @@ def save_response_content(response, destination):
                 f.write(chunk)
 
 
+def benchmark(model, *inputs, warmup=10, iters=100, **kwargs):
+    r'''
+    Measure time of calling the model.
+
+    Example::
+
+        stats = nnio.utils.benchmark(model, image, iters=200)
+        print('{:.1f} ms'.format(stats['median'] * 1000))
+
+    :parameter model: :class:`nnio.Model` or any function.
+    :parameter \*inputs: inputs to the model.
+    :parameter warmup: ``int``. Number of calls before measuring.
+    :parameter iters: ``int``. Number of measured calls.
+    :parameter \*\*kwargs: keyword arguments passed to the model.
+    :return: dictionary with call time statistics in seconds:
+        ``mean``, ``std``, ``min``, ``max``, ``median``, ``p90``, ``p99``,
+        and ``fps`` - number of calls per second.
+    '''
+    for _ in range(warmup):
+        model(*inputs, **kwargs)
+    times = np.empty(iters)
+    for i in range(iters):
+        start = time.perf_counter()
+        model(*inputs, **kwargs)
+        times[i] = time.perf_counter() - start
+    return {
+        'mean': float(times.mean()),
+        'std': float(times.std()),
+        'min': float(times.min()),
+        'max': float(times.max()),
+        'median': float(np.median(times)),
+        'p90': float(np.percentile(times, 90)),
+        'p99': float(np.percentile(times, 99)),
+        'fps': float(iters / times.sum()),
+    }
+
+
 # Flag setter
 def enable_logging_temperature(enable=True):
     global LOG_TEMPERATURE
     LOG_TEMPERATURE = enable
 
 def log_temperature(device, temperature):
-    # Get path to file
-    if device in temperature_files:
-        file_path = temperature_files[device]
-    else:
-        # Get base path for file
-        base_path = os.path.join(
-            '/home',
-            getpass.getuser(),
-            '.telemetry',
-        )
-        # Create path if not exists
-        if not os.path.exists(base_path):
-            pathlib.Path(base_path).mkdir(parents=True, exist_ok=True)
-        # Make file name
-        dev_id = device.replace('MYRIAD', '')
-        time_format = "vpu{}_%Y-%m-%d_%H-%M-%S".format(dev_id)
-        file_name = datetime.datetime.now().strftime(time_format)
-        file_path = os.path.join(base_path, file_name)
-        # Remember file path
-        temperature_files[device] = file_path
-        # Write first line to this file
-        with open(file_path, 'w') as f:
-            f.write('time,vpu_temp\n')
-            f.flush()
+    '''
+    Append temperature of the device to its telemetry file "/home/$USER/.telemetry/vpu<id>_<start time>".
+    Lines are buffered in memory and written in batches.
+    '''
+    with _telemetry_lock:
+        if device not in temperature_files:
+            # Get base path for file
+            base_path = os.path.join(
+                '/home',
+                getpass.getuser(),
+                '.telemetry',
+            )
+            # Make file name
+            dev_id = device.replace('MYRIAD', '')
+            time_format = "vpu{}_%Y-%m-%d_%H-%M-%S".format(dev_id)
+            file_name = datetime.datetime.now().strftime(time_format)
+            temperature_files[device] = TelemetryWriter(
+                os.path.join(base_path, file_name),
+                header='time,vpu_temp',
+            )
+        writer = temperature_files[device]
 
     val_time = datetime.datetime.now().isoformat(timespec='milliseconds')
     val_vpu_temp = int(temperature)
-    with open(file_path, 'a') as f:
-        f.write('{},{}\n'.format(val_time, val_vpu_temp))
-        f.flush()
+    writer.write('{},{}'.format(val_time, val_vpu_temp))
+
+
+class TelemetryWriter:
+    '''
+    Buffered writer of telemetry lines to a file.
+
+    The file is kept open. Lines are collected in memory and written
+    when ``buffer_size`` lines are collected or ``flush_interval`` seconds passed since the first of them was added.
+    The rest of the lines are written on :meth:`close` or at exit.
+    '''
+    def __init__(self, file_path, header=None, buffer_size=64, flush_interval=10.0):
+        '''
+        :parameter file_path: path to the file. Directories are created if they do not exist.
+        :parameter header: ``str`` or ``None``. First line of the file.
+        :parameter buffer_size: ``int``. Number of lines to collect before writing.
+        :parameter flush_interval: ``float``. Maximal time (in seconds) the lines are kept in memory.
+        '''
+        pathlib.Path(os.path.dirname(file_path)).mkdir(parents=True, exist_ok=True)
+        self.file_path = file_path
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._lock = threading.Lock()
+        # Writes buffered lines if no more lines come in time
+        self._timer = None
+        self._file = open(file_path, 'w')
+        if header is not None:
+            self._file.write(header + '\n')
+            self._file.flush()
+        atexit.register(self.close)
+
+    def write(self, line):
+        '''
+        Add line to the buffer.
+        '''
+        with self._lock:
+            if self._file.closed:
+                return
+            self._lines.append(line)
+            if len(self._lines) >= self.buffer_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        '''
+        Write buffered lines to the file.
+        '''
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush()
+            self._file.close()
+        atexit.unregister(self.close)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._lines or self._file.closed:
+            return
+        self._file.write('\n'.join(self._lines) + '\n')
+        self._file.flush()
+        self._lines = []
+
+
+class TelemetrySampler:
+    '''
+    Background thread which reads a value (e.g. device temperature) at a fixed rate.
+
+    Recent samples are kept in a ring buffer, so the latest value can be read without
+    calling the device.
+
+    Example::
+
+        sampler = nnio.utils.TelemetrySampler(read_temperature, interval=1.0)
+        temperature = sampler.latest
+        # List of (unix time, value)
+        history = sampler.history()
+        sampler.stop()
+    '''
+    def __init__(self, read_fn, interval=1.0, history_size=600, callback=None):
+        '''
+        :parameter read_fn: function without arguments which returns the value.
+        :parameter interval: ``float``. Time between samples in seconds.
+        :parameter history_size: ``int``. Number of samples kept in memory.
+        :parameter callback: function ``callback(value)`` called after each sample, e.g. to log it.
+        '''
+        self.read_fn = read_fn
+        self.interval = interval
+        self.callback = callback
+        self._samples = collections.deque(maxlen=history_size)
+        self._stop_event = threading.Event()
+        # Take the first sample right away, so that the latest value is always available
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name='TelemetrySampler', daemon=True)
+        self._thread.start()
+
+    @property
+    def latest(self):
+        '''
+        The latest sampled value.
+        '''
+        return self._samples[-1][1]
+
+    def history(self):
+        '''
+        :return: list of ``(unix time, value)`` tuples, the oldest first.
+        '''
+        return list(self._samples)
+
+    def stop(self):
+        '''
+        Stop the background thread.
+        '''
+        self._stop_event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e: # pylint: disable=broad-except
+                print('Telemetry sampling failed:', e)
+
+    def _sample(self):
+        value = self.read_fn()
+        self._samples.append((time.time(), value))
+        if self.callback is not None:
+            self.callback(value)
 
 
 class HumanDataBase:
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+def reid_forward(model, batch_size, image, return_info=False):
+    '''
+    Call a person re-identification model with one person or a batch of persons.
+
+    :parameter model: :class:`nnio.Model` which returns a batch of appearance vectors.
+    :parameter batch_size: batch dimension of the model input. Can be a fixed number or a symbolic name.
+        If it is 1, persons of a batch are passed to the model one at a time.
+    :parameter image: np array. Image of a person with batch dimension
+        or a batch of several persons made by :meth:`nnio.Preprocessing.crops`.
+    :parameter return_info: bool.
+        If ``True``, return inference time.
+    :return: np.array of shape ``[512]`` for one person, or of shape ``[N, 512]`` for a batch of ``N > 1`` persons.
+    '''
+    if len(image) > 1 and batch_size == 1:
+        # The model takes one person at a time
+        results = [
+            reid_forward(model, batch_size, person[None], return_info=return_info)
+            for person in image
+        ]
+        if return_info:
+            vectors = np.stack([vector for vector, _ in results])
+            info = {
+                'invoke_time': sum(info['invoke_time'] for _, info in results),
+            }
+            return vectors, info
+        return np.stack(results)
+    out = model(image, return_info=return_info)
+    if return_info:
+        vector, info = out
+    else:
+        vector = out
+    if len(vector) == 1:
+        vector = vector[0]
+    if return_info:
+        return vector, info
+    else:
+        return vector
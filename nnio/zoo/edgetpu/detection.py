@@ -23,13 +23,19 @@ class SSDMobileNet(_model.Model):
         self,
         device='CPU',
         version='v2',
-        threshold=0.5
+        threshold=0.5,
+        num_threads=None,
+        disable_default_delegates=False,
     ):
         '''
         :parameter device: str.
             ``CPU`` by default.
             Set ``TPU`` or ``TPU:0`` to use the first EdgeTPU device.
             Set ``TPU:1`` to use the second EdgeTPU device etc.
+        :parameter num_threads: ``int`` or ``None``.
+            Number of threads on CPU. See :class:`nnio.EdgeTPUModel`.
+        :parameter disable_default_delegates: ``bool``.
+            Run on CPU without XNNPACK delegate. See :class:`nnio.EdgeTPUModel`.
         :parameter version: str.
             Either "v1" or "v2"
         :parameter threshold: float.
@@ -44,7 +50,8 @@ class SSDMobileNet(_model.Model):
             model_path = self.URL_CPU.format(version)
         else:
             model_path = self.URL_TPU.format(version)
-        self.model = _edgetpu.EdgeTPUModel(model_path, device)
+        self.model = _edgetpu.EdgeTPUModel(
+            model_path, device, num_threads=num_threads, disable_default_delegates=disable_default_delegates)
 
         # Load labels from text file
         labels_path = _utils.file_from_url(self.URL_LABELS, 'labels_google')
@@ -111,13 +118,19 @@ class SSDMobileNetFace(_model.Model):
     def __init__(
         self,
         device='CPU',
-        threshold=0.5
+        threshold=0.5,
+        num_threads=None,
+        disable_default_delegates=False,
     ):
         '''
         :parameter device: str.
             ``CPU`` by default.
             Set ``TPU`` or ``TPU:0`` to use the first EdgeTPU device.
             Set ``TPU:1`` to use the second EdgeTPU device etc.
+        :parameter num_threads: ``int`` or ``None``.
+            Number of threads on CPU. See :class:`nnio.EdgeTPUModel`.
+        :parameter disable_default_delegates: ``bool``.
+            Run on CPU without XNNPACK delegate. See :class:`nnio.EdgeTPUModel`.
         :parameter threshold: float.
             Detection threshold. Affects the detector's sensitivity.
         '''
@@ -130,7 +143,8 @@ class SSDMobileNetFace(_model.Model):
             model_path = self.URL_CPU
         else:
             model_path = self.URL_TPU
-        self.model = _edgetpu.EdgeTPUModel(model_path, device)
+        self.model = _edgetpu.EdgeTPUModel(
+            model_path, device, num_threads=num_threads, disable_default_delegates=disable_default_delegates)
 
     def forward(self, image, return_info=False):
         '''
@@ -2,6 +2,7 @@ from ... import utils as _utils
 from ... import preprocessing as _preprocessing
 
 from ... import model as _model
+from .. import common as _common
 from ... import edgetpu as _edgetpu
 
 
@@ -20,12 +21,18 @@ class OSNet(_model.Model):
     def __init__(
         self,
         device='CPU',
+        num_threads=None,
+        disable_default_delegates=False,
     ):
         '''
         :parameter device: str.
             ``CPU`` by default.
             Set ``TPU`` or ``TPU:0`` to use the first EdgeTPU device.
             Set ``TPU:1`` to use the second EdgeTPU device etc.
+        :parameter num_threads: ``int`` or ``None``.
+            Number of threads on CPU. See :class:`nnio.EdgeTPUModel`.
+        :parameter disable_default_delegates: ``bool``.
+            Run on CPU without XNNPACK delegate. See :class:`nnio.EdgeTPUModel`.
         '''
         super().__init__()
 
@@ -34,26 +41,22 @@ class OSNet(_model.Model):
             model_path = self.URL_CPU
         else:
             model_path = self.URL_TPU
-        self.model = _edgetpu.EdgeTPUModel(model_path, device)
+        self.model = _edgetpu.EdgeTPUModel(
+            model_path, device, num_threads=num_threads, disable_default_delegates=disable_default_delegates)
+        # Batch dimension of the model input
+        self._batch_size = self.model.get_input_details()[0]['shape'][0]
 
     def forward(self, image, return_info=False):
         '''
         :parameter image: np array.
             Input image of a person.
+            Or a batch of several persons made by :meth:`nnio.Preprocessing.crops`.
         :parameter return_info: bool.
             If ``True``, return inference time.
         :return: np.array of shape ``[512]`` - person appearence vector. You can compare them by cosine or Euclidian distance.
+            If ``image`` is a batch of ``N > 1`` persons, np.array of shape ``[N, 512]``.
         '''
-        out = self.model(image, return_info=return_info)
-        if return_info:
-            vector, info = out
-        else:
-            vector = out
-        vector = vector[0]
-        if return_info:
-            return vector, info
-        else:
-            return vector
+        return _common.reid_forward(self.model, self._batch_size, image, return_info=return_info)
 
     def get_preprocessing(self):
         return _preprocessing.Preprocessing(
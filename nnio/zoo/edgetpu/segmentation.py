@@ -16,12 +16,16 @@ class DeepLabV3(_model.Model):
     URL_TPU = 'https://github.com/google-coral/edgetpu/raw/master/test_data/deeplabv3_mnv2_dm05_pascal_quant_edgetpu.tflite'
     URL_LABELS = 'https://github.com/google-coral/edgetpu/raw/master/test_data/pascal_voc_segmentation_labels.txt'
 
-    def __init__(self, device='CPU'):
+    def __init__(self, device='CPU', num_threads=None, disable_default_delegates=False):
         '''
         :parameter device: str.
             ``CPU`` by default.
             Set ``TPU`` or ``TPU:0`` to use the first EdgeTPU device.
             Set ``TPU:1`` to use the second EdgeTPU device etc.
+        :parameter num_threads: ``int`` or ``None``.
+            Number of threads on CPU. See :class:`nnio.EdgeTPUModel`.
+        :parameter disable_default_delegates: ``bool``.
+            Run on CPU without XNNPACK delegate. See :class:`nnio.EdgeTPUModel`.
         '''
         super().__init__()
 
@@ -30,7 +34,8 @@ class DeepLabV3(_model.Model):
             model_path = self.URL_CPU
         else:
             model_path = self.URL_TPU
-        self.model = _edgetpu.EdgeTPUModel(model_path, device)
+        self.model = _edgetpu.EdgeTPUModel(
+            model_path, device, num_threads=num_threads, disable_default_delegates=disable_default_delegates)
 
         # Load labels from text file
         labels_path = _utils.file_from_url(self.URL_LABELS, 'labels')
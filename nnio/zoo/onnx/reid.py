@@ -2,6 +2,7 @@ from ... import utils as _utils
 from ... import preprocessing as _preprocessing
 
 from ... import model as _model
+from .. import common as _common
 from ... import onnx as _onnx
 
 
@@ -25,25 +26,20 @@ class OSNet(_model.Model):
         # Load model
         url = f'gdrive://{self.GDRIVE_ID}/{self.FILE_NAME}'
         self.model = _onnx.ONNXModel(url)
+        # Batch dimension of the model input. Can be a fixed number or a symbolic name
+        self._batch_size = self.model.get_input_details()[0]['shape'][0]
 
     def forward(self, image, return_info=False):
         '''
         :parameter image: np array.
             Input image of a person.
+            Or a batch of several persons made by :meth:`nnio.Preprocessing.crops`.
         :parameter return_info: bool.
             If ``True``, return inference time.
         :return: np.array of shape ``[512]`` - person appearence vector. You can compare them by cosine or Euclidian distance.
+            If ``image`` is a batch of ``N > 1`` persons, np.array of shape ``[N, 512]``.
         '''
-        out = self.model(image, return_info=return_info)
-        if return_info:
-            vector, info = out
-        else:
-            vector = out
-        vector = vector[0]
-        if return_info:
-            return vector, info
-        else:
-            return vector
+        return _common.reid_forward(self.model, self._batch_size, image, return_info=return_info)
 
     def get_preprocessing(self):
         return _preprocessing.Preprocessing(
@@ -0,0 +1,43 @@
+import argparse
+import nnio
+import numpy as np
+
+MODELS = {
+    'detection': nnio.zoo.edgetpu.detection.SSDMobileNet,
+    'classification': nnio.zoo.edgetpu.classification.MobileNet,
+    'segmentation': nnio.zoo.edgetpu.segmentation.DeepLabV3,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare CPU thread counts and XNNPACK delegate on tflite zoo models'
+    )
+    parser.add_argument(
+        '--models', type=str, nargs='+', default=list(MODELS.keys()),
+        required=False,
+        help='Models to test: {}'.format(', '.join(MODELS.keys())))
+    parser.add_argument(
+        '--threads', type=int, nargs='+', default=[1, 2, 4],
+        required=False,
+        help='Numbers of CPU threads to test.')
+    parser.add_argument(
+        '--iters', type=int, default=50,
+        required=False,
+        help='Number of iterations to test speed.')
+    args = parser.parse_args()
+
+    for name in args.models:
+        for xnnpack in [False, True]:
+            for num_threads in args.threads:
+                model = MODELS[name](device='CPU', num_threads=num_threads, disable_default_delegates=not xnnpack)
+                # Prepare dummy input
+                inp = model.model.get_input_details()[0]
+                image = np.zeros(inp['shape'], dtype=np.uint8)
+                stats = nnio.utils.benchmark(model.model, image, iters=args.iters)
+                print('{:15} xnnpack={!s:5} threads={}: median {:.02f} ms, p99 {:.02f} ms'.format(
+                    name, xnnpack, num_threads, stats['median'] * 1000, stats['p99'] * 1000))
+
+
+if __name__ == '__main__':
+    main()
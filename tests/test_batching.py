@@ -0,0 +1,102 @@
+import concurrent.futures
+import gc
+import threading
+import nnio
+import numpy as np
+
+
+class DoubleModel(nnio.Model):
+    '''
+    Model which multiplies its input by 2 and remembers batch sizes
+    '''
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def forward(self, x, return_info=False):
+        with self.lock:
+            self.batch_sizes.append(len(x))
+        if return_info:
+            return [x * 2, x.sum(axis=1)], {'invoke_time': 0.0}
+        return [x * 2, x.sum(axis=1)]
+
+
+def test_batching():
+    inner = DoubleModel()
+    model = nnio.BatchingModel(inner, max_batch_size=8, max_wait=0.05)
+    inputs = [np.full([1, 3], i, dtype=np.float32) for i in range(32)]
+
+    with concurrent.futures.ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(model, inputs))
+    for x, (doubled, summed) in zip(inputs, results):
+        assert doubled.shape == (1, 3)
+        assert np.array_equal(doubled, x * 2)
+        assert np.array_equal(summed, x.sum(axis=1))
+    assert sum(inner.batch_sizes) == len(inputs)
+    assert max(inner.batch_sizes) <= 8
+    assert len(inner.batch_sizes) < len(inputs)
+
+    # Calls with different shapes are not batched together
+    futures = [model.submit(np.zeros([2, 3])), model.submit(np.zeros([1, 4]), return_info=True)]
+    assert futures[0].result()[0].shape == (2, 3)
+    out, info = futures[1].result()
+    assert out[0].shape == (1, 4)
+    assert info['batch_size'] == 1
+
+    model.close()
+
+
+class DictModel(nnio.Model):
+    '''
+    Model with named outputs, like OpenVINOModel with several outputs
+    '''
+    def forward(self, x):
+        return {'doubled': x * 2, 'first': x[:, :1]}
+
+
+def test_batching_dict_outputs():
+    model = nnio.BatchingModel(DictModel(), max_batch_size=8, max_wait=0.05)
+    inputs = [np.full([i % 2 + 1, 3], i, dtype=np.float32) for i in range(8)]
+    futures = [model.submit(x) for x in inputs]
+    for x, future in zip(inputs, futures):
+        out = future.result()
+        assert np.array_equal(out['doubled'], x * 2)
+        assert np.array_equal(out['first'], x[:, :1])
+    model.close()
+
+
+def test_close():
+    # Calls made while closing are either processed or rejected
+    model = nnio.BatchingModel(DictModel(), max_batch_size=4, max_wait=0.001)
+    futures = []
+    def call():
+        try:
+            while True:
+                futures.append(model.submit(np.zeros([1, 3])))
+        except BaseException: # pylint: disable=broad-except
+            pass
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    model.close()
+    for thread in threads:
+        thread.join()
+    done, not_done = concurrent.futures.wait(futures, timeout=5)
+    assert len(not_done) == 0
+    assert all(future.exception() is None for future in done)
+
+    # Model which is not closed is collected with its thread
+    model = nnio.BatchingModel(DictModel())
+    model(np.zeros([1, 3]))
+    worker = model._worker
+    del model
+    gc.collect()
+    worker.join(5)
+    assert not worker.is_alive()
+
+
+if __name__ == '__main__':
+    test_batching()
+    test_batching_dict_outputs()
+    test_close()
@@ -1,10 +1,210 @@
 import argparse
+import asyncio
+import itertools
+import os
 import cv2
 import nnio
 import time
 import numpy as np
 
 
+def make_identity_model(preproc, shape, opset):
+    '''
+    Onnx model which returns its input. Type of the input is the output type of ``preproc``.
+    '''
+    import pytest
+    pytest.importorskip('onnx')
+    from onnx import helper
+    dtype = helper.np_dtype_to_tensor_dtype(np.dtype(preproc.dtype))
+    graph = helper.make_graph(
+        [helper.make_node('Identity', ['x'], ['y'])],
+        'identity',
+        [helper.make_tensor_value_info('x', dtype, shape)],
+        [helper.make_tensor_value_info('y', dtype, shape)],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', opset)])
+    model.ir_version = 7
+    return nnio.ONNXModel(model.SerializeToString())
+
+
+def make_model_bytes():
+    '''
+    Serialized onnx model with input ``x`` of shape [2, 3] and two outputs:
+    ``doubled`` of a fixed shape [2, 3] and ``nonzero`` of a dynamic shape [2, N].
+    '''
+    import pytest
+    pytest.importorskip('onnx')
+    from onnx import helper, TensorProto
+    graph = helper.make_graph(
+        [
+            helper.make_node('Mul', ['x', 'two'], ['doubled']),
+            helper.make_node('NonZero', ['x'], ['nonzero']),
+        ],
+        'test',
+        [helper.make_tensor_value_info('x', TensorProto.FLOAT, [2, 3])],
+        [
+            helper.make_tensor_value_info('doubled', TensorProto.FLOAT, [2, 3]),
+            helper.make_tensor_value_info('nonzero', TensorProto.INT64, [2, 'n']),
+        ],
+        [helper.make_tensor('two', TensorProto.FLOAT, [], [2.0])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    return model.SerializeToString()
+
+
+def test_io_binding():
+    model = nnio.ONNXModel(make_model_bytes(), io_binding=True)
+    assert not model.thread_safe
+    assert [info['name'] for info in model.get_output_details()] == ['doubled', 'nonzero']
+    assert model.get_input_details()[0]['shape'] == [2, 3]
+
+    x = np.array([[0, 1, 2], [3, 0, 5]], dtype=np.float32)
+    doubled, nonzero = model(x)
+    assert np.array_equal(doubled, x * 2)
+    # Output of a dynamic shape is allocated by onnxruntime
+    assert np.array_equal(nonzero, np.array(np.nonzero(x)))
+
+    # Output of a fixed shape is overwritten by the next call
+    y = np.ones([2, 3], dtype=np.float32)
+    doubled_next, nonzero_next = model(y)
+    assert doubled_next is doubled
+    assert np.array_equal(doubled, y * 2)
+    # Output of a dynamic shape changes its shape and is not overwritten
+    assert nonzero_next.shape == (2, 6)
+    assert np.array_equal(nonzero, np.array(np.nonzero(x)))
+    # Non-contiguous inputs are accepted
+    assert np.array_equal(model(np.ones([3, 2], dtype=np.float32).T)[0], y * 2)
+
+
+def test_session_options(tmp_path, monkeypatch):
+    import onnxruntime as rt
+    # Keep the cache of the test in a temporary directory
+    def cache_dir(category, *subdirs):
+        path = os.path.join(str(tmp_path), category, *subdirs)
+        os.makedirs(path, exist_ok=True)
+        return path
+    monkeypatch.setattr(nnio.utils, 'cache_dir', cache_dir)
+    # Remember which files are loaded
+    loaded = []
+    session = rt.InferenceSession
+    def spy_session(path, *args, **kwargs):
+        loaded.append(path)
+        return session(path, *args, **kwargs)
+    monkeypatch.setattr(rt, 'InferenceSession', spy_session)
+
+    model_bytes = make_model_bytes()
+    x = np.ones([2, 3], dtype=np.float32)
+    for i in range(2):
+        model = nnio.ONNXModel(
+            model_bytes,
+            intra_op_num_threads=1,
+            execution_mode='sequential',
+            graph_optimization_level='all',
+            enable_mem_arena=False,
+            cache_optimized=True,
+        )
+        options = model.sess.get_session_options()
+        assert options.intra_op_num_threads == 1
+        assert options.execution_mode == rt.ExecutionMode.ORT_SEQUENTIAL
+        assert not options.enable_cpu_mem_arena
+        assert np.array_equal(model(x)[0], x * 2)
+        cached = os.listdir(os.path.join(str(tmp_path), 'onnx_optimized'))
+        assert len(cached) == 1 and cached[0].endswith('.onnx')
+        assert len(loaded) == i + 1
+        if i == 0:
+            assert loaded[0] == model_bytes
+        else:
+            # The optimized model is loaded from cache without optimizing it again
+            assert loaded[1] == os.path.join(str(tmp_path), 'onnx_optimized', cached[0])
+            assert options.graph_optimization_level == rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+
+    # Other options are cached separately
+    nnio.ONNXModel(model_bytes, graph_optimization_level='basic', cache_optimized=True)
+    assert len(os.listdir(os.path.join(str(tmp_path), 'onnx_optimized'))) == 2
+
+
+def test_submit():
+    model_bytes = make_model_bytes()
+    inputs = [np.full([2, 3], i, dtype=np.float32) for i in range(8)]
+
+    async def gather(model):
+        return await asyncio.gather(*[model.forward_async(x) for x in inputs])
+
+    # run_async needs at least 2 threads in the intra-op thread pool
+    model = nnio.ONNXModel(model_bytes, intra_op_num_threads=2)
+    calls = []
+    run_async = model.sess.run_async
+    def spy_run_async(*args):
+        calls.append(args)
+        return run_async(*args)
+    model.sess.run_async = spy_run_async
+    futures = [model.submit(x, return_info=True) for x in inputs]
+    for x, future in zip(inputs, futures):
+        (doubled, _), info = future.result()
+        assert np.array_equal(doubled, x * 2)
+        assert info['invoke_time'] >= 0
+    assert len(calls) == len(inputs)
+    assert model._run_async_supported
+    for x, (doubled, _) in zip(inputs, asyncio.run(gather(model))):
+        assert np.array_equal(doubled, x * 2)
+
+    # Fallback to the thread of the model
+    model = nnio.ONNXModel(model_bytes, intra_op_num_threads=1)
+    futures = [model.submit(x) for x in inputs]
+    for x, future in zip(inputs, futures):
+        assert np.array_equal(future.result()[0], x * 2)
+    assert not model._run_async_supported
+    for x, (doubled, _) in zip(inputs, asyncio.run(gather(model))):
+        assert np.array_equal(doubled, x * 2)
+
+    # With IOBinding outputs are overwritten by the next call, so results are taken one by one
+    model = nnio.ONNXModel(model_bytes, io_binding=True)
+    for x in inputs:
+        assert np.array_equal(model.submit(x).result()[0], x * 2)
+        assert np.array_equal(asyncio.run(model.forward_async(x))[0], x * 2)
+
+
+def test_fuse_preprocessing(tmp_path):
+    import onnx
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, [60, 80, 3], dtype=np.uint8)
+    options = itertools.product(
+        [9, 13], [None, (40, 30)], [None, 0, 1, 3], [False, True], ['uint8', 'float32'], [False, True], [False, True])
+    for opset, resize, to_gray, bgr, dtype, channels_first, batch_dimension in options:
+        if to_gray == 0 and channels_first:
+            continue
+        preproc = nnio.Preprocessing(
+            resize=resize,
+            to_gray=to_gray,
+            bgr=bgr,
+            dtype=dtype,
+            imagenet_scaling=dtype == 'float32',
+            channels_first=channels_first,
+            batch_dimension=batch_dimension,
+        )
+        expected = preproc(image)
+        save_path = str(tmp_path / 'fused.onnx')
+        model = make_identity_model(preproc, list(expected.shape), opset)
+        result = model.fuse_preprocessing(preproc, save_path=save_path)(image)
+        assert result.shape == expected.shape
+        assert result.dtype == expected.dtype
+        # One uint8 level, scaled by normalization
+        tolerance = 1.01 if dtype == 'uint8' else 1.01 * np.abs(preproc._scales).max()
+        assert np.abs(result.astype(np.float64) - expected).max() <= tolerance, str(preproc)
+        # Old models are converted to opset 11
+        assert onnx.load(save_path).opset_import[0].version == max(opset, 11)
+
+    # Padding is not supported
+    preproc = nnio.Preprocessing(resize=(40, 30), padding=True)
+    model = make_identity_model(preproc, [30, 40, 3], 13)
+    try:
+        model.fuse_preprocessing(preproc)
+        assert False
+    except BaseException as e: # pylint: disable=broad-except
+        assert 'padding' in str(e)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Measure inference time on dummy image input'
@@ -1,4 +1,5 @@
 import argparse
+import os
 import cv2
 import nnio
 import time
@@ -6,6 +7,116 @@ import numpy as np
 
 nnio.utils.enable_logging_temperature(True)
 
+
+def make_model_files(directory, batch=1):
+    '''
+    Save small openvino model with two outputs: [batch, 4] and [batch, 2].
+    Returns paths to bin and xml files.
+    '''
+    import pytest
+    onnx = pytest.importorskip('onnx')
+    ov = pytest.importorskip('openvino.runtime')
+    from onnx import helper, TensorProto
+    graph = helper.make_graph(
+        [
+            helper.make_node('Mul', ['input', 'two'], ['doubled']),
+            helper.make_node('Slice', ['input', 'starts', 'ends', 'axes'], ['first']),
+        ],
+        'test',
+        [helper.make_tensor_value_info('input', TensorProto.FLOAT, [batch, 4])],
+        [
+            helper.make_tensor_value_info('doubled', TensorProto.FLOAT, [batch, 4]),
+            helper.make_tensor_value_info('first', TensorProto.FLOAT, [batch, 2]),
+        ],
+        [
+            helper.make_tensor('two', TensorProto.FLOAT, [], [2.0]),
+            helper.make_tensor('starts', TensorProto.INT64, [1], [0]),
+            helper.make_tensor('ends', TensorProto.INT64, [1], [2]),
+            helper.make_tensor('axes', TensorProto.INT64, [1], [1]),
+        ],
+    )
+    onnx_path = str(directory / 'model.onnx')
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)]), onnx_path)
+    xml_path = str(directory / 'model.xml')
+    bin_path = str(directory / 'model.bin')
+    ov.serialize(ov.Core().read_model(onnx_path), xml_path, bin_path)
+    return bin_path, xml_path
+
+
+def test_submit_releases_request(tmp_path):
+    bin_path, xml_path = make_model_files(tmp_path)
+    model = nnio.OpenVINOModel(bin_path, xml_path, num_requests=2)
+    # Wrong input shape fails before the request starts
+    for _ in range(2):
+        try:
+            model.submit(np.zeros([3, 7], np.float32))
+            assert False
+        except Exception: # pylint: disable=broad-except
+            pass
+    assert model._idle_requests.qsize() == 2
+    out = model.submit(np.ones([1, 4], np.float32)).result()
+    assert np.allclose(out['doubled'], 2)
+
+
+def test_details(tmp_path):
+    bin_path, xml_path = make_model_files(tmp_path)
+    model = nnio.OpenVINOModel(bin_path, xml_path)
+    assert model.get_input_details() == [{'name': 'input', 'shape': [1, 4], 'dtype': 'FP32'}]
+    assert [out['name'] for out in model.get_output_details()] == ['doubled', 'first']
+    assert model.get_output_details()[1]['shape'] == [1, 2]
+
+
+def test_thread_safe(tmp_path):
+    bin_path, xml_path = make_model_files(tmp_path)
+    # A single infer request is not shared between callers
+    model = nnio.ThreadSafeModel(lambda: nnio.OpenVINOModel(bin_path, xml_path), replicas=2)
+    assert len(model.models) == 2
+    model = nnio.ThreadSafeModel(lambda: nnio.OpenVINOModel(bin_path, xml_path, num_requests=2), replicas=2)
+    assert len(model.models) == 1
+    out = model(np.ones([1, 4], np.float32))
+    assert np.allclose(out['doubled'], 2)
+
+
+def test_cache_compiled(tmp_path, monkeypatch):
+    bin_path, xml_path = make_model_files(tmp_path)
+    # Keep the cache of the test in a temporary directory
+    def cache_dir(category, *subdirs):
+        path = os.path.join(str(tmp_path / 'cache'), category, *subdirs)
+        os.makedirs(path, exist_ok=True)
+        return path
+    monkeypatch.setattr(nnio.utils, 'cache_dir', cache_dir)
+    x = np.ones([1, 4], np.float32)
+
+    # Exported blob
+    for cached in [False, True]:
+        model = nnio.OpenVINOModel(bin_path, xml_path, cache_compiled=True)
+        assert model.load_info['cached'] == cached
+        out, info = model(x, return_info=True)
+        assert np.allclose(out['doubled'], 2)
+        assert info['cached'] == cached
+        assert info['load_time'] == model.load_info['load_time']
+        assert model.submit(x, return_info=True).result()[1]['cached'] == cached
+    assert len(os.listdir(str(tmp_path / 'cache' / 'openvino_compiled'))) == 1
+
+    # Plugin which does not list IMPORT_EXPORT_SUPPORT raises an error when it is requested
+    import openvino.inference_engine as ie_module
+    class IECore(ie_module.IECore):
+        def get_metric(self, device_name, metric_name):
+            if metric_name == 'IMPORT_EXPORT_SUPPORT':
+                raise RuntimeError('Unsupported metric key')
+            metrics = super().get_metric(device_name, metric_name)
+            if metric_name == 'SUPPORTED_METRICS':
+                metrics = [metric for metric in metrics if metric != 'IMPORT_EXPORT_SUPPORT']
+            return metrics
+    monkeypatch.setattr(ie_module, 'IECore', IECore)
+    # openvino caches the compiled model in CACHE_DIR by itself
+    for cached in [False, True]:
+        model = nnio.OpenVINOModel(bin_path, xml_path, cache_compiled=True)
+        assert model.load_info['cached'] == cached
+        assert np.allclose(model(x)['doubled'], 2)
+    assert len(os.listdir(str(tmp_path / 'cache' / 'openvino_compiled'))) == 2
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Measure inference time on dummy image input'
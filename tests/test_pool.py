@@ -0,0 +1,124 @@
+import concurrent.futures
+import gc
+import threading
+import time
+import nnio
+import numpy as np
+
+
+class SlowModel(nnio.Model):
+    '''
+    Model which sleeps and remembers on which device it was called
+    '''
+    calls = []
+    lock = threading.Lock()
+
+    def __init__(self, device):
+        super().__init__()
+        self.device = device
+
+    def forward(self, x):
+        time.sleep(0.01)
+        with self.lock:
+            self.calls.append(self.device)
+        return x + 1
+
+
+def test_device_pool():
+    pool = nnio.DevicePool(SlowModel, devices=['CPU:0', 'CPU:1', 'CPU:2', 'CPU:3'])
+    inputs = [np.full([1, 2], i) for i in range(40)]
+
+    start = time.time()
+    results = list(pool.map(inputs))
+    elapsed = time.time() - start
+
+    # Results are in order
+    for x, y in zip(inputs, results):
+        assert np.array_equal(y, x + 1)
+    # All devices were used
+    assert set(SlowModel.calls) == set(pool.devices)
+    # Devices work at the same time
+    assert elapsed < 40 * 0.01 / 2
+
+    assert np.array_equal(pool(inputs[0]), inputs[0] + 1)
+    pool.close()
+
+
+class AddModel(nnio.Model):
+    def __init__(self, device):
+        super().__init__()
+        self.device = device
+
+    def forward(self, x):
+        return x + 1
+
+
+def test_device_pool_close():
+    # Calls made while closing are either processed or rejected
+    pool = nnio.DevicePool(AddModel, devices=['CPU:0', 'CPU:1'])
+    futures = []
+    def call():
+        try:
+            while True:
+                futures.append(pool.submit(np.zeros([1])))
+        except BaseException: # pylint: disable=broad-except
+            pass
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.01)
+    pool.close()
+    for thread in threads:
+        thread.join()
+    _, not_done = concurrent.futures.wait(futures, timeout=5)
+    assert len(not_done) == 0
+
+    # Pool which is not closed is collected with its threads
+    pool = nnio.DevicePool(AddModel, devices=['CPU:0', 'CPU:1'])
+    pool(np.zeros([1]))
+    workers = pool._workers
+    del pool
+    gc.collect()
+    for worker in workers:
+        worker.join(5)
+        assert not worker.is_alive()
+
+
+class UnsafeModel(nnio.Model):
+    '''
+    Model which fails if it is called from two threads at the same time
+    '''
+    def __init__(self):
+        super().__init__()
+        self.busy = False
+
+    def forward(self, x):
+        assert not self.busy
+        self.busy = True
+        time.sleep(0.01)
+        self.busy = False
+        return x + 1
+
+
+def test_thread_safe_model():
+    model = nnio.ThreadSafeModel(UnsafeModel, replicas=3)
+    assert len(model.models) == 3
+    futures = [model.submit(np.full([2], i)) for i in range(30)]
+    for i, future in enumerate(futures):
+        assert np.array_equal(future.result(), np.full([2], i + 1))
+
+    # Bounded wait
+    model = nnio.ThreadSafeModel(UnsafeModel(), replicas=1, timeout=0.01)
+    with model.acquire():
+        try:
+            model(np.zeros(2))
+            assert False
+        except TimeoutError:
+            pass
+    assert np.array_equal(model(np.zeros(2)), np.ones(2))
+
+
+if __name__ == '__main__':
+    test_device_pool()
+    test_device_pool_close()
+    test_thread_safe_model()
@@ -0,0 +1,316 @@
+import functools
+import http.server
+import io
+import os
+import struct
+import threading
+import cv2
+import nnio
+import numpy as np
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_PATH = os.path.join(TESTS_DIR, 'dogs.jpg')
+
+
+def serve_directory(directory):
+    '''
+    Start HTTP server in a background thread.
+    Returns the server and its base url
+    '''
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+def reference_preprocessing(image, preproc):
+    '''
+    Straightforward preprocessing in float64 in a fixed order of steps
+    '''
+    if preproc.bgr:
+        image = image[:, :, ::-1]
+    if preproc.resize is not None:
+        # pylint: disable=no-member
+        if preproc.padding:
+            ratio = max(image.shape[1] / preproc.resize[0], image.shape[0] / preproc.resize[1])
+            new_size = (int(image.shape[1] / ratio), int(image.shape[0] / ratio))
+            resized = cv2.resize(np.ascontiguousarray(image), new_size)
+            image = np.zeros([preproc.resize[1], preproc.resize[0], 3], dtype=np.uint8)
+            start_0 = (image.shape[0] - resized.shape[0]) // 2
+            start_1 = (image.shape[1] - resized.shape[1]) // 2
+            image[start_0: start_0 + resized.shape[0], start_1: start_1 + resized.shape[1]] = resized
+        else:
+            image = cv2.resize(np.ascontiguousarray(image), preproc.resize)
+    image = image.astype(np.float64)
+    if preproc._means is not None:
+        image = image - preproc._means
+    if preproc._scales is not None:
+        image = image * preproc._scales
+    if preproc.to_gray is not None:
+        image = image.mean(2, keepdims=preproc.to_gray > 0)
+        if preproc.to_gray > 1:
+            image = image.repeat(preproc.to_gray, axis=2)
+    if preproc.channels_first:
+        image = image.transpose([2, 0, 1])
+    return image.astype(preproc.dtype)
+
+
+def test_equivalence():
+    '''
+    Order of preprocessing steps is chosen depending on the image size.
+    Check that the result is the same up to rounding of uint8 values.
+    '''
+    rng = np.random.default_rng(0)
+    images = [
+        rng.integers(0, 256, size, dtype=np.uint8)
+        for size in [(480, 640, 3), (100, 60, 3)]
+    ]
+    normalizations = [
+        dict(),
+        dict(dtype='float32', divide_by_255=True),
+        dict(imagenet_scaling=True),
+        dict(dtype='float32', means=[1, 2, 3], scales=[0.5, 0.1, 2]),
+        dict(dtype='int16', means=100),
+    ]
+    for normalization in normalizations:
+        for resize, padding in [(None, False), ((224, 224), False), ((128, 256), True)]:
+            for to_gray in [None, 0, 1, 3]:
+                for bgr in [False, True]:
+                    preproc = nnio.Preprocessing(
+                        resize=resize,
+                        padding=padding,
+                        to_gray=to_gray,
+                        bgr=bgr,
+                        channels_first=to_gray is None or to_gray > 0,
+                        **normalization
+                    )
+                    # One uint8 level after normalization
+                    tolerance = 1.01 if preproc._scales is None else 1.01 * np.abs(preproc._scales).max()
+                    if 'int' in preproc.dtype:
+                        tolerance += 1
+                    for image in images:
+                        result = preproc(image)
+                        expected = reference_preprocessing(image, preproc)
+                        assert result.shape == expected.shape
+                        assert result.dtype == expected.dtype
+                        diff = np.abs(result.astype(np.float64) - expected).max()
+                        assert diff <= tolerance, (str(preproc), image.shape, diff)
+
+
+def test_read_image():
+    preproc = nnio.Preprocessing(resize=(300, 300), batch_dimension=True)
+    # pylint: disable=no-member
+    expected = preproc(cv2.imread(IMAGE_PATH)[:, :, ::-1])
+
+    # Read from disk
+    assert np.array_equal(preproc(IMAGE_PATH), expected)
+
+    # Decode from memory
+    with open(IMAGE_PATH, 'rb') as f:
+        data = f.read()
+    assert np.array_equal(preproc(data), expected)
+
+    # Download from local server
+    server, base_url = serve_directory(TESTS_DIR)
+    try:
+        url = base_url + '/dogs.jpg'
+        assert np.array_equal(preproc(url), expected)
+        batches = list(preproc.map([url] * 4, workers=2, batch_size=2))
+        assert len(batches) == 2
+        for batch in batches:
+            assert np.array_equal(batch, np.concatenate([expected, expected]))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_out():
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, [100, 120, 3], dtype=np.uint8) for _ in range(2)]
+    preproc = nnio.Preprocessing(resize=(64, 48), dtype='float32', imagenet_scaling=True, channels_first=True)
+
+    # Result is written into the given array
+    out = np.empty([3, 48, 64], dtype=np.float32)
+    assert preproc(images[0], out=out) is out
+    assert np.array_equal(out, preproc(images[0]))
+
+    # Wrong shape or data type
+    for wrong in [np.empty([48, 64, 3], dtype=np.float32), np.empty([3, 48, 64], dtype=np.float64)]:
+        try:
+            preproc(images[0], out=wrong)
+            assert False
+        except BaseException as e: # pylint: disable=broad-except
+            assert 'Expected out array' in str(e)
+
+    # Intermediate buffers are reused, but results of consecutive calls are not
+    first = preproc(images[0])
+    first_copy = first.copy()
+    second = preproc(images[1])
+    assert not np.shares_memory(first, second)
+    assert np.array_equal(first, first_copy)
+
+    # Number of channels is taken from the image if it is only resized
+    preproc = nnio.Preprocessing(resize=(64, 48), padding=True)
+    rgba = rng.integers(0, 256, [100, 120, 4], dtype=np.uint8)
+    assert preproc(rgba).shape == (48, 64, 4)
+    assert preproc(rgba[:, :, 0]).shape == (48, 64)
+
+
+def test_not_rgb():
+    '''
+    Images with other number of channels are normalized as well
+    '''
+    rng = np.random.default_rng(0)
+    rgba = rng.integers(0, 256, [50, 60, 4], dtype=np.uint8)
+    gray = rgba[:, :, 0].copy()
+
+    preproc = nnio.Preprocessing(dtype='float32', divide_by_255=True)
+    for image in [gray, rgba]:
+        result = preproc(image)
+        assert result.shape == image.shape
+        assert result.dtype == np.float32
+        assert np.allclose(result, image / 255)
+
+    preproc = nnio.Preprocessing(dtype='float32', means=127.5, stds=127.5, channels_first=True, batch_dimension=True)
+    assert np.allclose(preproc(rgba), ((rgba - 127.5) / 127.5).transpose([2, 0, 1])[None])
+    preproc = nnio.Preprocessing(dtype='float32', means=127.5, stds=127.5, resize=(30, 25))
+    # pylint: disable=no-member
+    assert np.allclose(preproc(gray), (cv2.resize(gray, (30, 25)) - 127.5) / 127.5)
+
+    # Channel order is reversed and grayscale is the average of all channels
+    assert np.array_equal(nnio.Preprocessing(bgr=True)(rgba), rgba[:, :, ::-1])
+    preproc = nnio.Preprocessing(dtype='float32', to_gray=1)
+    assert np.allclose(preproc(rgba), rgba.mean(2, keepdims=True))
+    preproc = nnio.Preprocessing(dtype='float32', divide_by_255=True, to_gray=3, bgr=True, channels_first=True)
+    assert np.allclose(preproc(rgba), (rgba / 255).mean(2)[None].repeat(3, axis=0))
+
+
+def test_letterbox_transform():
+    '''
+    Box found on the letterboxed image is mapped back to its place on the original image
+    '''
+    box = np.array([0.2, 0.3, 0.7, 0.9])
+    for height, width in [(480, 640), (640, 360)]:
+        image = np.zeros([height, width, 3], dtype=np.uint8)
+        image[int(box[1] * height): int(box[3] * height), int(box[0] * width): int(box[2] * width)] = 255
+        for resize in [(300, 300), (256, 128), (128, 256)]:
+            preproc = nnio.Preprocessing(resize=resize, padding=True)
+            prepared = preproc(image)
+            ys, xs = np.nonzero(prepared[:, :, 0] > 127)
+            found = np.array([
+                xs.min() / resize[0], ys.min() / resize[1], (xs.max() + 1) / resize[0], (ys.max() + 1) / resize[1]
+            ])
+            transform = preproc.get_transform(image)
+            assert str(transform) == str(preproc.get_transform(image.shape))
+            # Tolerance of two pixels of the resized image
+            tolerance = 2 / min(preproc._output_shape(image)[:2]) * max(height, width) / min(height, width)
+
+            # Arrays of any shape keep their shape
+            result = transform(found[None, None])
+            assert isinstance(result, np.ndarray)
+            assert result.shape == (1, 1, 4)
+            assert np.abs(result[0, 0] - box).max() < tolerance, (image.shape, resize, result)
+
+            # Boxes keep their label and score
+            boxes = transform([nnio.DetectionBox(*found, label='dog', score=0.5)])
+            assert np.allclose(nnio.output.boxes_to_array(boxes), result[0])
+            assert boxes[0].label == 'dog' and boxes[0].score == 0.5
+
+            # Coordinates outside the image are clipped
+            clipped = transform(np.array([[-1, -1, 2, 2]]))
+            assert np.array_equal(clipped, [[0, 0, 1, 1]])
+            assert transform(np.array([[-1, -1, 2, 2]]), clip=False).min() < 0
+
+    # Without padding the transform does not change boxes
+    transform = nnio.Preprocessing(resize=(300, 300)).get_transform(image)
+    assert np.array_equal(transform(box), box)
+
+
+def test_crops():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, [100, 200, 3], dtype=np.uint8)
+    preproc = nnio.Preprocessing(resize=(32, 64), dtype='float32', divide_by_255=True)
+    boxes = np.array([
+        [0.1, 0.2, 0.5, 0.9],
+        # Partly outside the image
+        [-0.5, -0.5, 0.25, 0.25],
+        # Completely outside the image: one pixel in the corner
+        [1.2, 1.2, 1.5, 1.5],
+    ])
+    expected = [
+        preproc(image[20: 90, 20: 100]),
+        preproc(image[: 25, : 50]),
+        preproc(image[99:, 199:]),
+    ]
+    batch = preproc.crops(image, boxes)
+    assert batch.shape == (3, 64, 32, 3)
+    for crop, crop_expected in zip(batch, expected):
+        assert np.array_equal(crop, crop_expected)
+
+    # Same result for a list of DetectionBox and with the output array given
+    out = np.empty_like(batch)
+    result = preproc.crops(image, [nnio.DetectionBox(*box) for box in boxes], out=out)
+    assert result is out
+    assert np.array_equal(result, batch)
+
+    # Expanded to the aspect ratio of resize: 40x20 pixels become 40x80
+    batch = preproc.crops(image, [[0.4, 0.4, 0.6, 0.6]], expand=True)
+    assert np.array_equal(batch[0], preproc(image[10: 90, 80: 120]))
+
+    # No boxes
+    assert preproc.crops(image, []).shape == (0, 64, 32, 3)
+
+
+def with_orientation(data, orientation):
+    '''
+    Insert EXIF segment with the orientation tag into an encoded jpeg image
+    '''
+    tiff = b'MM\x00*\x00\x00\x00\x08' + b'\x00\x01'
+    tiff += struct.pack('>HHIHH', 0x0112, 3, 1, orientation, 0) + b'\x00\x00\x00\x00'
+    payload = b'Exif\x00\x00' + tiff
+    return data[:2] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + data[2:]
+
+
+def test_reduced_decoding():
+    # Large jpeg image with smooth content, so that reduced decoding is close to resizing
+    image = np.zeros([1800, 2400, 3], dtype=np.uint8)
+    image[:, :, 0] = np.linspace(0, 255, 2400)[None]
+    image[:, :, 1] = np.linspace(0, 255, 1800)[:, None]
+    # pylint: disable=no-member
+    data = cv2.imencode('.jpg', image[:, :, ::-1])[1].tobytes()
+    assert nnio.preprocessing._jpeg_size(io.BytesIO(data)) == (2400, 1800)
+
+    # Factor is limited by the smaller ratio without padding and by the larger ratio with padding
+    assert nnio.preprocessing._reduction_factor((2400, 1800), (300, 300), False) == 4
+    assert nnio.preprocessing._reduction_factor((2400, 1800), (300, 300), True) == 8
+    assert nnio.preprocessing._reduction_factor((2400, 1800), (1000, 1000), False) == 1
+    assert nnio.preprocessing._reduction_factor((200, 150), (300, 300), False) == 0
+    assert nnio.Preprocessing._read_image(data, (300, 300)).shape == (450, 600, 3)
+    assert nnio.Preprocessing._read_image(data, (300, 300), padding=True).shape == (225, 300, 3)
+
+    # Result is close to the preprocessing of the full image
+    preproc = nnio.Preprocessing(resize=(300, 300))
+    diff = np.abs(preproc(data).astype(int) - preproc(image).astype(int))
+    assert diff.mean() < 2
+
+    # Original image is returned at full resolution
+    _, original = preproc(data, return_original=True)
+    assert original.shape == image.shape
+
+    # Image rotated according to EXIF is too small at the chosen factor, so it is decoded again
+    rotated = with_orientation(data, 6)
+    assert nnio.preprocessing._reduction_factor((2400, 1800), (600, 150), False) == 4
+    assert nnio.Preprocessing._read_image(rotated, (600, 150)).shape == (2400, 1800, 3)
+    assert nnio.Preprocessing._read_image(rotated).shape == (2400, 1800, 3)
+
+
+if __name__ == '__main__':
+    test_equivalence()
+    test_read_image()
+    test_out()
+    test_not_rgb()
+    test_letterbox_transform()
+    test_crops()
+    test_reduced_decoding()
+    print('OK')
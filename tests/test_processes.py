@@ -0,0 +1,29 @@
+import nnio
+import numpy as np
+
+
+class SplitModel(nnio.Model):
+    '''
+    Model which returns arrays and other values
+    '''
+    def forward(self, x, scale=1):
+        return [x * scale, {'sum': x.sum(), 'label': 'ok'}]
+
+
+def test_process_pool():
+    model = nnio.ProcessPoolModel(SplitModel, workers=2, slab_size=1024)
+    # Inputs of different sizes, some of them do not fit into the initial shared memory
+    for size in [10, 10000, 100]:
+        x = np.random.rand(2, size).astype(np.float32)
+        out = model(x, scale=2)
+        assert np.allclose(out[0], x * 2)
+        assert np.isclose(out[1]['sum'], x.sum())
+        assert out[1]['label'] == 'ok'
+    futures = [model.submit(np.full([3], i)) for i in range(8)]
+    for i, future in enumerate(futures):
+        assert np.array_equal(future.result()[0], np.full([3], i))
+    model.close()
+
+
+if __name__ == '__main__':
+    test_process_pool()
@@ -0,0 +1,143 @@
+import os
+import nnio
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+
+class Identity(torch.nn.Module):
+    def forward(self, x):
+        return x
+
+
+class ConvNet(torch.nn.Module):
+    '''
+    Small convolutional model with list and dict outputs
+    '''
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 4, 3, padding=1)
+
+    def forward(self, x):
+        y = torch.relu(self.conv(x))
+        return [y, {'sum': y.sum(dim=(2, 3)), 'max': y.amax(dim=(2, 3))}]
+
+
+def save_model(module, directory, name='model.pt'):
+    torch.manual_seed(0)
+    path = str(directory / name)
+    torch.jit.save(torch.jit.script(module.eval()), path)
+    return path
+
+
+def use_cache_dir(monkeypatch, directory):
+    ''' Keep caches of the test in a temporary directory '''
+    def cache_dir(category, *subdirs):
+        path = os.path.join(str(directory), category, *subdirs)
+        os.makedirs(path, exist_ok=True)
+        return path
+    monkeypatch.setattr(nnio.utils, 'cache_dir', cache_dir)
+
+
+def test_inputs_share_memory(tmp_path):
+    model = nnio.TorchModel(save_model(Identity(), tmp_path))
+    x = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert np.shares_memory(model(x), x)
+
+    # Arrays which torch can not use directly are copied
+    read_only = x.copy()
+    read_only.flags.writeable = False
+    result = model(read_only)
+    assert np.array_equal(result, x)
+    assert not np.shares_memory(result, read_only)
+    reversed_x = x[:, ::-1]
+    assert np.array_equal(model(reversed_x), reversed_x)
+
+
+def test_outputs(tmp_path):
+    model = nnio.TorchModel(save_model(ConvNet(), tmp_path))
+    x = np.random.default_rng(0).standard_normal([2, 3, 8, 8]).astype(np.float32)
+    features, stats = model(x)
+    assert isinstance(features, np.ndarray)
+    assert features.shape == (2, 4, 8, 8)
+    assert sorted(stats) == ['max', 'sum']
+    assert np.allclose(stats['sum'], features.sum(axis=(2, 3)), atol=1e-4)
+    _, info = model(x, return_info=True)
+    assert info['invoke_time'] > 0
+
+
+def test_freeze(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / 'cache')
+    model_path = save_model(ConvNet(), tmp_path)
+    x = np.random.default_rng(0).standard_normal([1, 3, 8, 8]).astype(np.float32)
+    expected = nnio.TorchModel(model_path)(x)
+
+    loaded = []
+    load = torch.jit.load
+    def spy_load(path, *args, **kwargs):
+        loaded.append(path)
+        return load(path, *args, **kwargs)
+    monkeypatch.setattr(torch.jit, 'load', spy_load)
+    optimized = []
+    optimize = torch.jit.optimize_for_inference
+    def spy_optimize(module, *args, **kwargs):
+        optimized.append(module)
+        return optimize(module, *args, **kwargs)
+    monkeypatch.setattr(torch.jit, 'optimize_for_inference', spy_optimize)
+
+    for i in range(2):
+        model = nnio.TorchModel(model_path, freeze=True)
+        result = model(x)
+        assert np.allclose(result[0], expected[0], atol=1e-5)
+        assert np.allclose(result[1]['sum'], expected[1]['sum'], atol=1e-3)
+        cached = os.listdir(str(tmp_path / 'cache' / 'torch_frozen'))
+        assert len(cached) == 1 and cached[0].endswith('.pt')
+        # The second time the frozen model is loaded from cache. It is optimized after loading every time
+        assert len(loaded) == i + 1
+        if i == 0:
+            assert loaded[0] == model_path
+        else:
+            assert loaded[1].startswith(str(tmp_path / 'cache'))
+        assert len(optimized) == i + 1
+
+
+def test_channels_last(tmp_path):
+    # Inputs already in NHWC layout are not copied
+    model = nnio.TorchModel(save_model(Identity(), tmp_path), memory_format='channels_last')
+    x_nhwc = np.random.default_rng(0).standard_normal([2, 8, 8, 3]).astype(np.float32)
+    x = x_nhwc.transpose(0, 3, 1, 2)
+    assert np.shares_memory(model(x), x_nhwc)
+
+    model_path = save_model(ConvNet(), tmp_path)
+    model = nnio.TorchModel(model_path, memory_format='channels_last')
+    assert model.model.conv.weight.is_contiguous(memory_format=torch.channels_last)
+    expected = nnio.TorchModel(model_path)(x)
+    assert np.allclose(model(np.ascontiguousarray(x))[0], expected[0], atol=1e-5)
+    accuracy = model.check_accuracy(x)
+    assert sorted(accuracy) == ['max_abs_diff', 'max_rel_diff', 'mean_abs_diff']
+    assert accuracy['max_abs_diff'] < 1e-4
+
+
+def test_bf16(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / 'cache')
+    model_path = save_model(ConvNet(), tmp_path)
+    x = np.random.default_rng(0).standard_normal([1, 3, 8, 8]).astype(np.float32)
+    expected = nnio.TorchModel(model_path)(x)
+    for freeze in [False, True]:
+        model = nnio.TorchModel(model_path, precision='bf16', freeze=freeze)
+        features, _ = model(x)
+        # Outputs are converted back to float32
+        assert features.dtype == np.float32
+        assert np.allclose(features, expected[0], atol=0.1)
+        accuracy = model.check_accuracy(x)
+        assert 0 < accuracy['max_abs_diff'] < 0.1
+        assert accuracy['max_rel_diff'] < 0.05
+
+
+if __name__ == '__main__':
+    import pathlib
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        test_inputs_share_memory(pathlib.Path(directory))
+        test_outputs(pathlib.Path(directory))
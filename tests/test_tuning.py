@@ -0,0 +1,70 @@
+import os
+import time
+import nnio
+import numpy as np
+
+
+class SleepModel(nnio.Model):
+    '''
+    Model which takes a given time
+    '''
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def forward(self, x):
+        time.sleep(self.delay)
+        return x
+
+
+def test_autotune():
+    candidates = {
+        'slow': lambda: SleepModel(0.005),
+        'fast': lambda: SleepModel(0.001),
+        'broken': lambda: SleepModel(None),
+    }
+    model, report = nnio.autotune(
+        candidates, np.zeros([1, 3]), warmup=1, iters=5, use_cache=False, return_report=True)
+    assert report['best'] == 'fast'
+    assert model.delay == 0.001
+    assert 'error' in report['results']['broken']
+
+
+def test_autotune_cache(tmp_path, monkeypatch):
+    # Keep the cache of the test in a temporary directory
+    def cache_dir(category, *subdirs):
+        path = os.path.join(str(tmp_path), category, *subdirs)
+        os.makedirs(path, exist_ok=True)
+        return path
+    monkeypatch.setattr(nnio.utils, 'cache_dir', cache_dir)
+    slow, fast = 'slow', 'fast'
+    candidates = {
+        slow: lambda: SleepModel(0.005),
+        fast: lambda: SleepModel(0.001),
+    }
+    _, report = nnio.autotune(candidates, np.zeros([1, 3]), warmup=1, iters=5, return_report=True)
+    assert report['best'] == fast
+
+    # The decision is read from the cache
+    model, cached_report = nnio.autotune(candidates, np.zeros([1, 3]), warmup=1, iters=5, return_report=True)
+    assert cached_report == report
+    assert model.delay == 0.001
+
+    # The chosen model can not be created anymore, so the candidates are measured again
+    def broken():
+        raise RuntimeError('device not found')
+    candidates[fast] = broken
+    model, report = nnio.autotune(candidates, np.zeros([1, 3]), warmup=1, iters=5, return_report=True)
+    assert report['best'] == slow
+    assert model.delay == 0.005
+
+    # Decisions with another key are not used
+    candidates[fast] = lambda: SleepModel(0.001)
+    candidates[slow] = lambda: SleepModel(0.01)
+    assert nnio.autotune(candidates, np.zeros([1, 3]), warmup=1, iters=5).delay == 0.01
+    assert nnio.autotune(candidates, np.zeros([1, 3]), warmup=1, iters=5, cache_key='v2').delay == 0.001
+    assert os.listdir(str(tmp_path)) == ['autotune']
+
+
+if __name__ == '__main__':
+    test_autotune()
@@ -0,0 +1,88 @@
+import itertools
+import threading
+import time
+import nnio
+
+
+def read_lines(path):
+    with open(str(path)) as f:
+        return f.read().splitlines()
+
+
+def test_telemetry_writer(tmp_path):
+    path = tmp_path / 'telemetry' / 'device.csv'
+    writer = nnio.utils.TelemetryWriter(str(path), header='time,value', buffer_size=3, flush_interval=60)
+    assert read_lines(path) == ['time,value']
+    # Lines are buffered until there are enough of them
+    writer.write('0,0')
+    writer.write('1,1')
+    assert read_lines(path) == ['time,value']
+    writer.write('2,2')
+    assert read_lines(path) == ['time,value', '0,0', '1,1', '2,2']
+    # The rest of the lines are written on close
+    writer.write('3,3')
+    writer.close()
+    assert read_lines(path)[-1] == '3,3'
+    writer.close()
+    writer.write('4,4')
+    assert read_lines(path)[-1] == '3,3'
+
+
+def test_telemetry_writer_interval(tmp_path):
+    path = tmp_path / 'device.csv'
+    writer = nnio.utils.TelemetryWriter(str(path), buffer_size=100, flush_interval=0.05)
+    writer.write('0')
+    writer.write('1')
+    assert read_lines(path) == []
+    # Lines are written after flush_interval even if nothing else is written
+    deadline = time.monotonic() + 5
+    while read_lines(path) != ['0', '1'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_lines(path) == ['0', '1']
+    writer.write('2')
+    writer.close()
+    assert read_lines(path) == ['0', '1', '2']
+
+
+def test_telemetry_sampler():
+    counter = itertools.count()
+    values = []
+    enough = threading.Event()
+    def callback(value):
+        values.append(value)
+        if len(values) >= 5:
+            enough.set()
+    sampler = nnio.utils.TelemetrySampler(lambda: next(counter), interval=0.01, history_size=3, callback=callback)
+    # The first sample is taken right away
+    assert values[0] == 0
+    assert enough.wait(5)
+    sampler.stop()
+    assert not sampler._thread.is_alive()
+    # History is limited by history_size
+    history = sampler.history()
+    assert [value for _, value in history] == values[-3:]
+    assert sampler.latest == values[-1]
+    assert history[0][0] <= history[-1][0]
+    # No samples after stop
+    time.sleep(0.05)
+    assert sampler.latest == values[-1]
+
+
+def test_telemetry_sampler_errors():
+    def read_fn():
+        if calls:
+            raise RuntimeError('device is busy')
+        calls.append(1)
+        return 42
+    calls = []
+    sampler = nnio.utils.TelemetrySampler(read_fn, interval=0.01)
+    # Failed samples do not stop the thread
+    time.sleep(0.05)
+    assert sampler._thread.is_alive()
+    assert sampler.latest == 42
+    sampler.stop()
+
+
+if __name__ == '__main__':
+    test_telemetry_sampler()
+    test_telemetry_sampler_errors()